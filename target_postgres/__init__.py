@@ -1,3 +1,5 @@
+from contextlib import ExitStack
+
 from singer import utils
 import psycopg2
 
@@ -9,35 +11,58 @@ REQUIRED_CONFIG_KEYS = [
 ]
 
 
+def _connect(config):
+    return psycopg2.connect(
+        connection_factory=MillisLoggingConnection,
+        host=config.get('postgres_host', 'localhost'),
+        port=config.get('postgres_port', 5432),
+        dbname=config.get('postgres_database'),
+        user=config.get('postgres_username'),
+        password=config.get('postgres_password'),
+        sslmode=config.get('postgres_sslmode'),
+        sslcert=config.get('postgres_sslcert'),
+        sslkey=config.get('postgres_sslkey'),
+        sslrootcert=config.get('postgres_sslrootcert'),
+        sslcrl=config.get('postgres_sslcrl'),
+        application_name=config.get('application_name', 'target-postgres'),
+    )
+
+
+def _target(config, stack):
+    connection = stack.enter_context(_connect(config))
+    table_connections = [stack.enter_context(_connect(config))
+                         for _ in range(config.get('table_connections') or 0)]
+
+    target = PostgresTarget(
+        connection,
+        postgres_schema=config.get('postgres_schema', 'public'),
+        logging_level=config.get('logging_level'),
+        persist_empty_tables=config.get('persist_empty_tables'),
+        add_upsert_indexes=config.get('add_upsert_indexes', True),
+        binary_copy=config.get('binary_copy', False),
+        merge_strategy=config.get('merge_strategy', 'delete_insert'),
+        append_only_streams=config.get('append_only_streams'),
+        before_run_sql=config.get('before_run_sql'),
+        after_run_sql=config.get('after_run_sql'),
+        table_connections=table_connections,
+    )
+    stack.callback(target.close)
+
+    return target
+
+
 def main(config, input_stream=None):
-    with psycopg2.connect(
-            connection_factory=MillisLoggingConnection,
-            host=config.get('postgres_host', 'localhost'),
-            port=config.get('postgres_port', 5432),
-            dbname=config.get('postgres_database'),
-            user=config.get('postgres_username'),
-            password=config.get('postgres_password'),
-            sslmode=config.get('postgres_sslmode'),
-            sslcert=config.get('postgres_sslcert'),
-            sslkey=config.get('postgres_sslkey'),
-            sslrootcert=config.get('postgres_sslrootcert'),
-            sslcrl=config.get('postgres_sslcrl'),
-            application_name=config.get('application_name', 'target-postgres'),
-    ) as connection:
-        postgres_target = PostgresTarget(
-            connection,
-            postgres_schema=config.get('postgres_schema', 'public'),
-            logging_level=config.get('logging_level'),
-            persist_empty_tables=config.get('persist_empty_tables'),
-            add_upsert_indexes=config.get('add_upsert_indexes', True),
-            before_run_sql=config.get('before_run_sql'),
-            after_run_sql=config.get('after_run_sql'),
-        )
+    with ExitStack() as stack:
+        postgres_target = _target(config, stack)
+
+        writer_targets = []
+        for _ in range(1, config.get('writer_connections') or 1):
+            writer_targets.append(_target(config, stack))
 
         if input_stream:
-            target_tools.stream_to_target(input_stream, postgres_target, config=config)
+            target_tools.stream_to_target(input_stream, postgres_target, config=config, writer_targets=writer_targets)
         else:
-            target_tools.main(postgres_target)
+            target_tools.main(postgres_target, writer_targets=writer_targets)
 
 
 def cli():
@@ -0,0 +1,62 @@
+class AdaptiveBatchSize():
+    """
+    Tunes the number of rows per batch of a stream, within `min_rows` and `max_rows`, from the throughput and the
+    buffered size of its written batches.
+
+    Batches start at `min_rows`, and are scaled by `GROWTH_FACTOR` in the current direction for as long as the
+    throughput, in rows per second, improves by more than `TOLERANCE`. When the throughput worsens by more than
+    `TOLERANCE`, ie, when writing took disproportionately longer, the direction is reversed. Otherwise the size is kept.
+    A step which cannot go any further past `min_rows` or `max_rows` reverses the direction too.
+
+    While growing, batches whose buffered size per row grows by more than `TOLERANCE`, ie, whose memory grows faster
+    than their rows, are shrunk regardless of their throughput.
+    """
+
+    GROWTH_FACTOR = 2
+    TOLERANCE = 0.1
+
+    def __init__(self, min_rows, max_rows):
+        self.min_rows = min_rows
+        self.max_rows = max(min_rows, max_rows)
+        self.rows = self.min_rows
+        self.growing = True
+        self.last_throughput = None
+        self.last_row_size = None
+
+    def batch_written(self, rows, seconds, size=None):
+        """
+        Record that a batch of `rows` rows took `seconds` to write.
+        :param rows: int
+        :param seconds: float
+        :param size: int, the size in bytes the batch was buffered in, if known
+        :return: int, the number of rows for the following batches
+        """
+        ## Batches flushed well before they were full, eg, for STATE messages, say little about the size
+        if rows < self.rows / 2 or seconds <= 0:
+            return self.rows
+
+        throughput = rows / seconds
+        row_size = size / rows if size else None
+
+        if self.growing and row_size is not None and self.last_row_size is not None \
+                and row_size > self.last_row_size * (1 + self.TOLERANCE):
+            self.growing = False
+            self._step()
+        elif self.last_throughput is None or throughput > self.last_throughput * (1 + self.TOLERANCE):
+            self._step()
+        elif throughput < self.last_throughput * (1 - self.TOLERANCE):
+            self.growing = not self.growing
+            self._step()
+
+        self.last_throughput = throughput
+        self.last_row_size = row_size
+        return self.rows
+
+    def _step(self):
+        if self.rows == (self.max_rows if self.growing else self.min_rows):
+            self.growing = not self.growing
+
+        if self.growing:
+            self.rows = min(self.max_rows, int(self.rows * self.GROWTH_FACTOR))
+        else:
+            self.rows = max(self.min_rows, int(self.rows / self.GROWTH_FACTOR))
@@ -17,19 +17,42 @@ def to_table_batches(schema, key_properties, records):
                             ...]},
               ...]
     """
-    table_schemas = _get_streamed_table_schemas(schema,
-                                                key_properties)
-
-    table_records = _get_streamed_table_records(key_properties,
-                                                records)
     writeable_batches = []
-    for table_json_schema in table_schemas:
-        writeable_batches.append({'streamed_schema': table_json_schema,
-                                  'records': table_records.get(table_json_schema['path'], [])})
+    for table_batch in iter_table_batches(schema, key_properties, records):
+        writeable_batches.append({'streamed_schema': table_batch['streamed_schema'],
+                                  'records': list(table_batch['records'])})
 
     return writeable_batches
 
 
+def iter_table_batches(schema, key_properties, records, flatten=True):
+    """
+    Like `to_table_batches`, but each `table_batch`'s records are a generator which denests
+    `records` as it is consumed. Only the rows of the table being consumed are ever built,
+    so the denested batch never has to be held in memory as a whole.
+
+    :param schema: SingerStreamSchema
+    :param key_properties: [string, ...]
+    :param records: [{...}, ...], iterated over once per table
+    :param flatten: when False, each table's records are left as they are found in `records`,
+                    along with the `_sdc_*` key values the table's rows need from their parents
+    :return: generator of {'streamed_schema': TABLE_SCHEMA(local),
+                           'records': generator of {(path_0, path_1, ...):
+                                                    (_json_schema_string_type, value), ...}
+                                      | generator of ({...}, {'_sdc_*': value, ...})}
+    """
+    for table_json_schema in _get_streamed_table_schemas(schema,
+                                                         key_properties):
+        table_records = _denest_records(table_json_schema['path'],
+                                        records,
+                                        key_properties)
+        if flatten:
+            table_records = (_flatten_record(record, pk_fks) for record, pk_fks in table_records)
+
+        yield {'streamed_schema': table_json_schema,
+               'records': table_records}
+
+
 def _get_streamed_table_schemas(schema, key_properties):
     """
     Given a `schema` and `key_properties` return the denested/flattened TABLE_SCHEMA of
@@ -224,71 +247,24 @@ def _denest_schema(
     table_json_schema['properties'] = new_properties
 
 
-def _get_streamed_table_records(key_properties, records):
-    """
-    Flatten the given `records` into `table_records`.
-    Maintains `key_properties`.
-    into `table_records`.
-
-    :param key_properties: [string, ...]
-    :param records: [{...}, ...]
-    :return: {TableName string: [{(path_0, path_1, ...): (_json_schema_string_type, value), ...}, ...],
-              ...}
-    """
-
-    records_map = {}
-    _denest_records(tuple(),
-                    records,
-                    records_map,
-                    key_properties)
-
-    return records_map
-
-
-def _denest_subrecord(table_path,
-                      prop_path,
-                      parent_record,
-                      record,
-                      records_map,
-                      key_properties,
-                      pk_fks,
-                      level):
-    """"""
+def _flatten_subrecord(prop_path, record, denested_record):
     """
     {...}
     """
     for prop, value in record.items():
         """
-        str : {...} | [...] | ???None??? | <literal>
+        str : {...} | [...] | None | <literal>
         """
 
         if isinstance(value, dict):
             """
             {...}
             """
-            _denest_subrecord(table_path + (prop,),
-                              prop_path + (prop,),
-                              parent_record,
-                              value,
-                              records_map,
-                              key_properties,
-                              pk_fks,
-                              level)
-
-        elif isinstance(value, list):
-            """
-            [...]
-            """
-            _denest_records(table_path + (prop,),
-                            value,
-                            records_map,
-                            key_properties,
-                            pk_fks=pk_fks,
-                            level=level + 1)
-
-        elif value is None:
+            _flatten_subrecord(prop_path + (prop,), value, denested_record)
+
+        elif isinstance(value, list) or value is None:
             """
-            None
+            [...] | None, subtable rows are denested separately
             """
             continue
 
@@ -296,66 +272,28 @@ def _denest_subrecord(table_path,
             """
             <literal>
             """
-            parent_record[prop_path + (prop,)] = (json_schema.python_type(value), value)
+            denested_record[prop_path + (prop,)] = (json_schema.python_type(value), value)
 
 
-def _denest_record(table_path, record, records_map, key_properties, pk_fks, level):
-    """"""
-    """
-    {...}
-    """
+def _flatten_record(record, pk_fks):
     denested_record = {}
-    for prop, value in record.items():
-        """
-        str : {...} | [...] | None | <literal>
-        """
+    _flatten_subrecord(tuple(), dict(record, **pk_fks), denested_record)
+    return denested_record
 
-        if isinstance(value, dict):
-            """
-            {...}
-            """
-            _denest_subrecord(table_path + (prop,),
-                              (prop,),
-                              denested_record,
-                              value,
-                              records_map,
-                              key_properties,
-                              pk_fks,
-                              level)
-
-        elif isinstance(value, list):
-            """
-            [...]
-            """
-            _denest_records(table_path + (prop,),
-                            value,
-                            records_map,
-                            key_properties,
-                            pk_fks=pk_fks,
-                            level=level + 1)
-
-        elif value is None:
-            """
-            None
-            """
-            continue
 
-        else:
-            """
-            <literal>
-            """
-            denested_record[(prop,)] = (json_schema.python_type(value), value)
-
-    if table_path not in records_map:
-        records_map[table_path] = []
-    records_map[table_path].append(denested_record)
-
-
-def _denest_records(table_path, records, records_map, key_properties, pk_fks=None, level=-1):
-    row_index = 0
+def _denest_records(table_path, records, key_properties, pk_fks=None, level=-1):
     """
-    [{...} ...] | [[...] ...] | [literal ...]
+    Yield the records of the table at `table_path`, relative to the table `records` belong
+    to, by following `table_path` through nested objects and arrays.
+    Maintains `key_properties`.
+
+    :param table_path: (string, ...)
+    :param records: [{...} ...] | [[...] ...] | [literal ...]
+    :param key_properties: [string, ...]
+    :return: generator of ({...}, {'_sdc_*': value, ...}), the record and the keys its row
+             inherits from its parents
     """
+    row_index = 0
     for record in records:
         if pk_fks:
             record_pk_fks = pk_fks.copy()
@@ -367,8 +305,7 @@ def _denest_records(table_path, records, records_map, key_properties, pk_fks=Non
                 """
                 record = {singer.VALUE: record}
 
-            for key, value in record_pk_fks.items():
-                record[key] = value
+            row_pk_fks = record_pk_fks
             row_index += 1
         else:  ## top level
             record_pk_fks = {}
@@ -377,7 +314,26 @@ def _denest_records(table_path, records, records_map, key_properties, pk_fks=Non
             if singer.SEQUENCE in record:
                 record_pk_fks[singer.SEQUENCE] = record[singer.SEQUENCE]
 
+            row_pk_fks = {}
+
+        if not table_path:
+            yield record, row_pk_fks
+            continue
+
         """
-        {...}
+        {...} are part of the current table, [...] are subtables
         """
-        _denest_record(table_path, record, records_map, key_properties, record_pk_fks, level)
+        value = record
+        for i, prop in enumerate(table_path):
+            value = value.get(prop)
+
+            if isinstance(value, list):
+                yield from _denest_records(table_path[i + 1:],
+                                           value,
+                                           key_properties,
+                                           pk_fks=record_pk_fks,
+                                           level=level + 1)
+                break
+
+            if not isinstance(value, dict):
+                break
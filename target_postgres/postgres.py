@@ -1,16 +1,21 @@
+from concurrent import futures
 from copy import deepcopy
 import csv
+from datetime import datetime, timezone
 from functools import lru_cache
 import io
+from itertools import islice
 import json
 import logging
+import queue
 import re
+import struct
 import time
 import uuid
 import hashlib
 
 import arrow
-from psycopg2 import sql
+from psycopg2 import extensions, sql
 from psycopg2.extras import LoggingConnection, LoggingCursor
 
 from target_postgres import json_schema, singer
@@ -19,6 +24,65 @@ from target_postgres.sql_base import SEPARATOR, SQLInterface
 
 
 RESERVED_NULL_DEFAULT = 'NULL'
+MERGE_STRATEGY_DELETE_INSERT = 'delete_insert'
+MERGE_STRATEGY_ON_CONFLICT = 'on_conflict'
+MERGE_STRATEGIES = (MERGE_STRATEGY_DELETE_INSERT, MERGE_STRATEGY_ON_CONFLICT)
+COPY_ROWS_PER_CHUNK = 1000
+COPY_READ_SIZE = 1048576  # 1MB
+
+_POSTGRES_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+_BINARY_COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+_BINARY_COPY_TRAILER = struct.pack('!h', -1)
+_BINARY_NULL = struct.pack('!i', -1)
+_BINARY_INT16 = struct.Struct('!h')
+_BINARY_INT32 = struct.Struct('!i')
+_BINARY_BIGINT = struct.Struct('!iq')
+_BINARY_DOUBLE = struct.Struct('!id')
+_BINARY_BOOLEAN = struct.Struct('!i?')
+
+
+def _binary_copy_encoder(sql_type, encoding):
+    """
+    Given a column's `sql_type`, as produced by `PostgresTarget.json_schema_to_sql_type`, return a
+    function which encodes a non-null value as a field of a binary COPY tuple.
+
+    :param sql_type: string
+    :param encoding: string, Python codec for the connection's client encoding
+    :return: function
+    """
+    sql_type = sql_type.replace(' NOT NULL', '')
+
+    if sql_type in ('bigint', 'timestamp with time zone'):
+        return lambda value: _BINARY_BIGINT.pack(8, int(value))
+    if sql_type == 'double precision':
+        return lambda value: _BINARY_DOUBLE.pack(8, float(value))
+    if sql_type == 'boolean':
+        return lambda value: _BINARY_BOOLEAN.pack(1, value)
+    if sql_type == 'text':
+        def encode_text(value):
+            encoded = str(value).encode(encoding)
+            return _BINARY_INT32.pack(len(encoded)) + encoded
+
+        return encode_text
+
+    raise PostgresError('Unsupported type `{}` for binary COPY'.format(sql_type))
+
+
+def _parse_datetime(value):
+    """
+    Parse a date-time string into a timezone aware datetime, which is taken to be UTC when
+    `value` has no offset. ISO 8601 strings are parsed natively, and anything else by arrow.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return arrow.get(value).datetime
+
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
 
 @lru_cache(maxsize=128)
 def _format_datetime(value):
@@ -29,6 +93,17 @@ def _format_datetime(value):
     """
     return arrow.get(value).format('YYYY-MM-DD HH:mm:ss.SSSSZZ')
 
+
+@lru_cache(maxsize=128)
+def _datetime_to_postgres_micros(value):
+    """
+    Convert a datetime value to PostgreSQL's binary `timestamp with time zone` representation,
+    ie, microseconds since 2000-01-01 00:00:00 UTC. This is only called from the
+    PostgresTarget.serialize_table_record_datetime_value when `binary_copy` is enabled.
+    """
+    delta = _parse_datetime(value) - _POSTGRES_EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
 def _update_schema_0_to_1(table_metadata, table_schema):
     """
     Given a `table_schema` of version 0, update it to version 1.
@@ -96,11 +171,102 @@ class MillisLoggingConnection(LoggingConnection):
 
 
 class TransformStream:
-    def __init__(self, fun):
-        self.fun = fun
+    """
+    A file-like object which lazily encodes `rows` as CSV for `cursor.copy_expert`. Each row is a
+    sequence of values ordered like the columns being copied.
+
+    Rows are encoded many at a time into a single reusable buffer, and `read` returns
+    at most `size` characters per call, as requested by psycopg2. `count` is the number of
+    rows encoded so far.
+    """
+
+    EMPTY = ''
 
-    def read(self, *args, **kwargs):
-        return self.fun()
+    def __init__(self, rows, rows_per_chunk=COPY_ROWS_PER_CHUNK):
+        self._rows = iter(rows)
+        self._rows_per_chunk = rows_per_chunk
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = self.EMPTY
+        self._exhausted = False
+        self.count = 0
+
+    def _encode_chunk(self):
+        """
+        Encode up to `rows_per_chunk` rows into the buffer.
+        :return: string
+        """
+        writerow = self._writer.writerow
+
+        for row in islice(self._rows, self._rows_per_chunk):
+            writerow(row)
+            self.count += 1
+
+        chunk = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+        if not chunk:
+            self._exhausted = True
+
+        return chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = [self._pending]
+            while not self._exhausted:
+                chunks.append(self._encode_chunk())
+            self._pending = self.EMPTY
+            return self.EMPTY.join(chunks)
+
+        while len(self._pending) < size and not self._exhausted:
+            self._pending += self._encode_chunk()
+
+        ret = self._pending[:size]
+        self._pending = self._pending[size:]
+        return ret
+
+
+class BinaryTransformStream(TransformStream):
+    """
+    A TransformStream which encodes `rows` in PostgreSQL's binary COPY format. Each column is
+    encoded by the matching function in `encoders`, with `None` values encoded as NULL.
+    """
+
+    EMPTY = b''
+
+    def __init__(self, rows, encoders, rows_per_chunk=COPY_ROWS_PER_CHUNK):
+        super(BinaryTransformStream, self).__init__(rows, rows_per_chunk=rows_per_chunk)
+        self._buffer = io.BytesIO()
+        self._buffer.write(_BINARY_COPY_HEADER)
+        self._pending = b''
+        self._encoders = encoders
+        self._tuple_header = _BINARY_INT16.pack(len(encoders))
+        self._wrote_trailer = False
+
+    def _encode_chunk(self):
+        buffer = self._buffer
+        encoders = self._encoders
+        tuple_header = self._tuple_header
+
+        for row in islice(self._rows, self._rows_per_chunk):
+            buffer.write(tuple_header)
+            for value, encoder in zip(row, encoders):
+                buffer.write(_BINARY_NULL if value is None else encoder(value))
+            self.count += 1
+
+        if not self._wrote_trailer and buffer.tell() == 0:
+            buffer.write(_BINARY_COPY_TRAILER)
+            self._wrote_trailer = True
+
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+        if not chunk:
+            self._exhausted = True
+
+        return chunk
 
 
 class PostgresTarget(SQLInterface):
@@ -114,6 +280,10 @@ class PostgresTarget(SQLInterface):
         logging_level=None,
         persist_empty_tables=False,
         add_upsert_indexes=True,
+        binary_copy=False,
+        merge_strategy=MERGE_STRATEGY_DELETE_INSERT,
+        append_only_streams=None,
+        table_connections=None,
         **kwargs):
 
         self.LOGGER.info(
@@ -134,10 +304,59 @@ class PostgresTarget(SQLInterface):
         self.postgres_schema = postgres_schema
         self.persist_empty_tables = persist_empty_tables
         self.add_upsert_indexes = add_upsert_indexes
+        self.binary_copy = binary_copy
+        self.merge_strategy = merge_strategy or MERGE_STRATEGY_DELETE_INSERT
+        self.append_only_streams = set(append_only_streams or [])
+        self.table_connections = list(table_connections or [])
+
+        if self.merge_strategy not in MERGE_STRATEGIES:
+            raise PostgresError('Unknown `merge_strategy` `{}`. Expected one of {}'.format(
+                self.merge_strategy,
+                list(MERGE_STRATEGIES)))
 
         if self.persist_empty_tables:
             self.LOGGER.debug('PostgresTarget is persisting empty tables')
 
+        if self.binary_copy:
+            self.LOGGER.debug('PostgresTarget is using binary COPY')
+
+        ## The tables of a batch are written concurrently over `table_connections`, each connection
+        ## holding its transaction open until the whole batch has been written.
+        self._table_writers = None
+        self._idle_table_connections = queue.Queue()
+        self._table_batch_writes = None
+        self._root_table_connection = None  # the table connection the root table of the batch was written over
+        if self.table_connections:
+            for table_connection in self.table_connections:
+                try:
+                    table_connection.initialize(self.LOGGER)
+                except AttributeError:
+                    pass
+                self._idle_table_connections.put(table_connection)
+
+            self._table_writers = futures.ThreadPoolExecutor(max_workers=len(self.table_connections),
+                                                             thread_name_prefix='target-postgres-table-writer')
+            self.LOGGER.debug('PostgresTarget is writing tables over {} connections'.format(
+                len(self.table_connections)))
+
+        ## Remote table schemas and metadata are cached for the lifetime of the target. They are
+        ## invalidated by the target's own DDL, and in full whenever the catalog fingerprint for
+        ## `postgres_schema`, or for any cached table, changes between batches.
+        self.table_mapping_cache = {}
+        self._catalog_fingerprint = None
+        self._catalog_changed = False
+        self._table_catalog_digests = {}
+        self._table_schema_cache = {}
+        self._table_metadata_cache = {}
+        self._upserted_table_schemas = {}
+
+        ## While upserting a table, metadata changes are only made to `_table_metadata_cache`, and
+        ## the names of the changed tables collected here to be written all at once.
+        self._pending_table_metadata = None
+        ## Likewise, column changes are collected here as `ALTER TABLE` clauses per table name, to
+        ## be run as a single statement.
+        self._pending_table_alterations = None
+
         with self.conn.cursor() as cur:
             self._update_schemas_0_to_1(cur)
             self._update_schemas_1_to_2(cur)
@@ -216,7 +435,107 @@ class PostgresTarget(SQLInterface):
         return {'database': self.conn.get_dsn_parameters().get('dbname', None),
                 'schema': self.postgres_schema}
 
+    def _get_catalog_fingerprint(self, cur, table_names):
+        """
+        Returns a hash which changes whenever a table in `postgres_schema` is created, renamed, or
+        dropped, along with a digest for each of `table_names` which changes whenever its columns
+        or comment are altered. Only the tables the target has cached are digested, so that the
+        check stays cheap however many tables `postgres_schema` holds.
+
+        :param cur: Pscyopg.Cursor
+        :param table_names: [string, ...]
+        :return: (string, {table_name: string})
+        """
+        cur.execute(sql.SQL('''
+            SELECT
+                (SELECT md5(string_agg(c.oid::text || ':' || c.relname, ',' ORDER BY c.oid))
+                 FROM pg_namespace AS n
+                     INNER JOIN pg_class AS c ON n.oid = c.relnamespace
+                 WHERE n.nspname = {schema} AND c.relkind = 'r'),
+                (SELECT json_object_agg(c.relname,
+                                        c.xmin::text || ':' || coalesce(d.xmin::text, '') || ':'
+                                        || coalesce(a.xmins, ''))
+                 FROM pg_namespace AS n
+                     INNER JOIN pg_class AS c ON n.oid = c.relnamespace
+                     LEFT JOIN pg_description AS d ON d.objoid = c.oid
+                                                      AND d.classoid = 'pg_class'::regclass
+                                                      AND d.objsubid = 0
+                     LEFT JOIN LATERAL (
+                         SELECT string_agg(pa.xmin::text, '.' ORDER BY pa.attnum) AS xmins
+                         FROM pg_attribute AS pa
+                         WHERE pa.attrelid = c.oid AND pa.attnum > 0) AS a ON TRUE
+                 WHERE n.nspname = {schema} AND c.relkind = 'r' AND c.relname = ANY({table_names}));
+        ''').format(schema=sql.Literal(self.postgres_schema),
+                    table_names=sql.Literal(list(table_names))))
+
+        fingerprint, digests = cur.fetchone()
+        return fingerprint, digests or {}
+
+    def _track_table_catalog(self, cur, table_name):
+        """
+        Record the catalog digest of `table_name` before it is first cached, so that changes made
+        by other sessions after it has been read are detected by the next batch.
+
+        :param cur: Pscyopg.Cursor
+        :param table_name: string
+        :return: None
+        """
+        if table_name in self._table_catalog_digests:
+            return None
+
+        _, digests = self._get_catalog_fingerprint(cur, [table_name])
+        self._table_catalog_digests[table_name] = digests.get(table_name)
+
+    def _invalidate_table_schema(self, table_name):
+        """
+        Drop the cached TABLE_SCHEMA for `table_name` after the target has changed it.
+
+        :param table_name: string
+        :return: None
+        """
+        self._table_schema_cache.pop(table_name, None)
+        self._catalog_changed = True
+
+    def upserted_table_schemas(self):
+        return self._upserted_table_schemas
+
+    def _reset_catalog_cache(self):
+        """
+        Drop all cached table mappings, TABLE_SCHEMAs and metadata.
+
+        :return: None
+        """
+        self._catalog_fingerprint = None
+        self._catalog_changed = False
+        self._table_catalog_digests = {}
+        self._table_schema_cache = {}
+        self._table_metadata_cache = {}
+        self._upserted_table_schemas = {}
+
+    def _commit_catalog_cache(self, cur):
+        """
+        Called before a batch commits. When the batch changed the catalog, the caches are reloaded
+        by the next batch: fingerprinting the catalog now would also take in changes which other
+        sessions committed during the batch, without the caches reflecting them.
+
+        :param cur: Pscyopg.Cursor
+        :return: None
+        """
+        if self._catalog_changed:
+            self._catalog_fingerprint = None
+            self._catalog_changed = False
+
     def setup_table_mapping_cache(self, cur):
+        fingerprint, digests = self._get_catalog_fingerprint(cur, list(self._table_catalog_digests))
+
+        if fingerprint is not None \
+                and fingerprint == self._catalog_fingerprint \
+                and all(digests.get(table_name) == digest
+                        for table_name, digest in self._table_catalog_digests.items()):
+            return None
+
+        self._reset_catalog_cache()
+        self._catalog_fingerprint = fingerprint
         self.table_mapping_cache = {}
 
         cur.execute(sql.SQL('''
@@ -301,22 +620,57 @@ class PostgresTarget(SQLInterface):
 
                 self.LOGGER.info('Root table name {}'.format(root_table_name))
 
-                written_batches_details = self.write_batch_helper(cur,
-                                                                  root_table_name,
-                                                                  stream_buffer.schema,
-                                                                  stream_buffer.key_properties,
-                                                                  stream_buffer.get_batch(),
-                                                                  {'version': target_table_version})
+                ## Generated `_sdc_primary_key`s can never collide with existing rows, so streams
+                ## without key properties have nothing to merge
+                append_only = stream_buffer.use_uuid_pk or stream_buffer.stream in self.append_only_streams
 
+                if self._table_writers is not None:
+                    self._table_batch_writes = []
+                    self._root_table_connection = None
+                try:
+                    written_batches_details = self.write_batch_helper(cur,
+                                                                      root_table_name,
+                                                                      stream_buffer.schema,
+                                                                      stream_buffer.key_properties,
+                                                                      stream_buffer.get_batch(),
+                                                                      {'version': target_table_version,
+                                                                       'append_only': append_only})
+                finally:
+                    table_batch_writes = self._wait_for_table_batch_writes()
+
+                for table_batch_write in table_batch_writes:
+                    table_batch_write.result()
+
+                self._commit_catalog_cache(cur)
+
+                ## The transaction holding the root table's rows, and so their `_sdc_sequence`s, commits
+                ## first. Nested tables are merged by `_sdc_sequence` too, so should committing them fail
+                ## afterwards, replaying the batch writes them again.
+                if self._root_table_connection is not None:
+                    self._root_table_connection.commit()
                 cur.execute('COMMIT;')
+                self._end_table_connection_transactions(commit=True)
 
                 return written_batches_details
             except Exception as ex:
                 cur.execute('ROLLBACK;')
+                self._end_table_connection_transactions(commit=False)
+                self._reset_catalog_cache()
                 message = 'Exception writing records'
                 self.LOGGER.exception(message)
                 raise PostgresError(message, ex)
 
+    def close(self):
+        """
+        Stop the threads writing over `table_connections`, if any. The connections themselves are
+        left to whoever opened them.
+
+        :return: None
+        """
+        if self._table_writers is not None:
+            self._table_writers.shutdown(wait=True)
+            self._table_writers = None
+
     def activate_version(self, stream_buffer, version):
         with self.conn.cursor() as cur:
             try:
@@ -360,6 +714,7 @@ class PostgresTarget(SQLInterface):
                                                             'old'),
                             stream_table=sql.Identifier(table_name),
                             version_table=sql.Identifier(versioned_table_name)))
+                        self._reset_catalog_cache()
                         metadata = self._get_table_metadata(cur, table_name)
 
                         self.LOGGER.info('Activated {}, setting path to {}'.format(
@@ -371,6 +726,7 @@ class PostgresTarget(SQLInterface):
                         self._set_table_metadata(cur, table_name, metadata)
             except Exception as ex:
                 cur.execute('ROLLBACK;')
+                self._reset_catalog_cache()
                 message = '{} - Exception activating table version {}'.format(
                     stream_buffer.stream,
                     version)
@@ -445,9 +801,7 @@ class PostgresTarget(SQLInterface):
         full_table_name = sql.SQL('{}.{}').format(
             sql.Identifier(self.postgres_schema),
             sql.Identifier(target_table_name))
-        full_temp_table_name = sql.SQL('{}.{}').format(
-            sql.Identifier(self.postgres_schema),
-            sql.Identifier(temp_table_name))
+        full_temp_table_name = sql.Identifier(temp_table_name)
 
         pk_temp_select_list = []
         pk_where_list = []
@@ -549,14 +903,94 @@ class PostgresTarget(SQLInterface):
                         insert_columns=insert_columns,
                         dedupped_columns=dedupped_columns)
 
+    def _get_on_conflict_update_sql(self, target_table_name, temp_table_name, key_properties, columns):
+        full_table_name = sql.SQL('{}.{}').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(target_table_name))
+        full_temp_table_name = sql.Identifier(temp_table_name)
+
+        pk_select = sql.SQL(', ').join(map(sql.Identifier, key_properties))
+        insert_columns = sql.SQL(', ').join(map(sql.Identifier, columns))
+
+        update_columns = [column for column in columns if column not in key_properties]
+        if update_columns:
+            conflict_action = sql.SQL('''DO UPDATE SET {update_columns}
+                WHERE "excluded".{sequence} >= {table}.{sequence}''').format(
+                update_columns=sql.SQL(', ').join(
+                    sql.SQL('{column} = "excluded".{column}').format(column=sql.Identifier(column))
+                    for column in update_columns),
+                sequence=sql.Identifier(singer.SEQUENCE),
+                table=full_table_name)
+        else:
+            conflict_action = sql.SQL('DO NOTHING')
+
+        return sql.SQL('''
+            INSERT INTO {table}({insert_columns}) (
+                SELECT DISTINCT ON ({pk_select}) {insert_columns}
+                FROM {temp_table}
+                ORDER BY {pk_select}, {sequence} DESC
+            )
+            ON CONFLICT ({pk_select}) {conflict_action};
+            DROP TABLE {temp_table};
+            ''').format(table=full_table_name,
+                        temp_table=full_temp_table_name,
+                        insert_columns=insert_columns,
+                        pk_select=pk_select,
+                        sequence=sql.Identifier(singer.SEQUENCE),
+                        conflict_action=conflict_action)
+
+    def _has_unique_index(self, cur, table_name, column_names):
+        """
+        Returns True when `table_name` has a unique index on exactly `column_names`, ie, one
+        which `INSERT ... ON CONFLICT` can use as its arbiter.
+        """
+        cur.execute(sql.SQL('''
+            SELECT EXISTS (
+                SELECT 1 FROM pg_index AS ix
+                WHERE ix.indrelid = {}::regclass
+                      AND ix.indisunique
+                      AND ix.indpred IS NULL
+                      AND ix.indexprs IS NULL
+                      AND (SELECT array_agg(a.attname::text ORDER BY a.attname::text)
+                           FROM pg_attribute AS a
+                           WHERE a.attrelid = ix.indrelid AND a.attnum = ANY(ix.indkey)) = {}::text[]);
+        ''').format(
+            sql.Literal('"{}"."{}"'.format(self.postgres_schema, table_name)),
+            sql.Literal(sorted(column_names))))
+
+        return cur.fetchone()[0]
+
     def serialize_table_record_null_value(self, remote_schema, streamed_schema, field, value):
-        if value is None:
+        if value is None and not self.binary_copy:
             return RESERVED_NULL_DEFAULT
         return value
 
     def serialize_table_record_datetime_value(self, remote_schema, streamed_schema, field, value):
+        if self.binary_copy:
+            return _datetime_to_postgres_micros(value)
         return _format_datetime(value)
 
+    def _copy_rows(self, cur, table, columns, csv_rows):
+        """
+        COPY the rows streamed by `csv_rows` into `table`.
+
+        :param cur: Pscyopg.Cursor
+        :param table: psycopg2.sql.Composable, the (possibly schema qualified) table
+        :param columns: [string, ...]
+        :param csv_rows: TransformStream
+        :return: None
+        """
+        if self.binary_copy:
+            copy = sql.SQL('COPY {} ({}) FROM STDIN WITH (FORMAT binary)').format(
+                table,
+                sql.SQL(', ').join(map(sql.Identifier, columns)))
+        else:
+            copy = sql.SQL('COPY {} ({}) FROM STDIN WITH CSV NULL AS {}').format(
+                table,
+                sql.SQL(', ').join(map(sql.Identifier, columns)),
+                sql.Literal(RESERVED_NULL_DEFAULT))
+        cur.copy_expert(copy, csv_rows, size=COPY_READ_SIZE)
+
     def persist_csv_rows(self,
                          cur,
                          remote_schema,
@@ -564,12 +998,7 @@ class PostgresTarget(SQLInterface):
                          columns,
                          csv_rows):
 
-        copy = sql.SQL('COPY {}.{} ({}) FROM STDIN WITH CSV NULL AS {}').format(
-            sql.Identifier(self.postgres_schema),
-            sql.Identifier(temp_table_name),
-            sql.SQL(', ').join(map(sql.Identifier, columns)),
-            sql.Literal(RESERVED_NULL_DEFAULT))
-        cur.copy_expert(copy, csv_rows)
+        self._copy_rows(cur, sql.Identifier(temp_table_name), columns, csv_rows)
 
         pattern = re.compile(singer.LEVEL_FMT.format('[0-9]+'))
         subkeys = list(filter(lambda header: re.match(pattern, header) is not None, columns))
@@ -577,43 +1006,101 @@ class PostgresTarget(SQLInterface):
         canonicalized_key_properties = [self.fetch_column_from_path((key_property,), remote_schema)[0]
                                         for key_property in remote_schema['key_properties']]
 
-        update_sql = self._get_update_sql(remote_schema['name'],
-                                          temp_table_name,
-                                          canonicalized_key_properties,
-                                          columns,
-                                          subkeys)
+        ## Only root tables can be merged with `ON CONFLICT`, and only when the remote has
+        ## an index for Postgres to detect the conflicts with
+        if self.merge_strategy == MERGE_STRATEGY_ON_CONFLICT \
+                and not subkeys \
+                and self._has_unique_index(cur, remote_schema['name'], canonicalized_key_properties):
+            update_sql = self._get_on_conflict_update_sql(remote_schema['name'],
+                                                          temp_table_name,
+                                                          canonicalized_key_properties,
+                                                          columns)
+        else:
+            update_sql = self._get_update_sql(remote_schema['name'],
+                                              temp_table_name,
+                                              canonicalized_key_properties,
+                                              columns,
+                                              subkeys)
         cur.execute(update_sql)
 
     def write_table_batch(self, cur, table_batch, metadata):
+        ## Tables changed by this batch are locked by its transaction until it commits, so once the
+        ## catalog has changed, the remaining tables are written through that transaction instead
+        if self._table_batch_writes is not None and not self._catalog_changed:
+            ## Rows are counted as they are submitted, so they are serialized up front
+            records = list(table_batch['records'])
+            self._table_batch_writes.append(self._table_writers.submit(self._write_table_batch_on_table_connection,
+                                                                       dict(table_batch, records=records),
+                                                                       metadata))
+            return len(records)
+
+        return self._write_table_batch(cur, table_batch, metadata)
+
+    def _write_table_batch_on_table_connection(self, table_batch, metadata):
+        table_connection = self._idle_table_connections.get()
+        try:
+            with table_connection.cursor() as cur:
+                rows_count = self._write_table_batch(cur, table_batch, metadata)
+            if len(table_batch['remote_schema'].get('path', ())) == 1:
+                self._root_table_connection = table_connection
+            return rows_count
+        finally:
+            self._idle_table_connections.put(table_connection)
+
+    def _wait_for_table_batch_writes(self):
+        """
+        Wait for every table batch submitted to `table_connections` to finish.
+
+        :return: [concurrent.futures.Future, ...]
+        """
+        table_batch_writes = self._table_batch_writes or []
+        self._table_batch_writes = None
+
+        futures.wait(table_batch_writes)
+        return table_batch_writes
+
+    def _end_table_connection_transactions(self, commit):
+        """
+        Commit, or roll back, the transactions the batch has open on `table_connections`. Called
+        once the batch's own transaction has ended, see `write_batch` for the order of commits.
+
+        :param commit: boolean
+        :return: None
+        """
+        for table_connection in self.table_connections:
+            if commit:
+                table_connection.commit()
+            else:
+                table_connection.rollback()
+
+    def _write_table_batch(self, cur, table_batch, metadata):
         remote_schema = table_batch['remote_schema']
+        csv_headers = list(remote_schema['schema']['properties'].keys())
+        csv_rows = self._transform_stream(cur, remote_schema, csv_headers, table_batch['records'])
+
+        ## Append only batches have nothing to merge, and are copied straight into the table
+        if metadata.get('append_only'):
+            self._copy_rows(cur,
+                            sql.SQL('{}.{}').format(
+                                sql.Identifier(self.postgres_schema),
+                                sql.Identifier(remote_schema['name'])),
+                            csv_headers,
+                            csv_rows)
+
+            return csv_rows.count
 
         ## Create temp table to upload new data to
+        ### Session local and dropped on commit, so staged rows are never WAL logged
+        ### and no catalog entries are left behind in the target schema
         target_table_name = self.canonicalize_identifier('tmp_' + str(uuid.uuid4()))
         cur.execute(sql.SQL('''
-            CREATE TABLE {schema}.{temp_table} (LIKE {schema}.{table})
+            CREATE TEMPORARY TABLE {temp_table} (LIKE {schema}.{table}) ON COMMIT DROP
         ''').format(
             schema=sql.Identifier(self.postgres_schema),
             temp_table=sql.Identifier(target_table_name),
             table=sql.Identifier(remote_schema['name'])
         ))
 
-        ## Make streamable CSV records
-        csv_headers = list(remote_schema['schema']['properties'].keys())
-        rows_iter = iter(table_batch['records'])
-
-        def transform():
-            try:
-                row = next(rows_iter)
-
-                with io.StringIO() as out:
-                    writer = csv.DictWriter(out, csv_headers)
-                    writer.writerow(row)
-                    return out.getvalue()
-            except StopIteration:
-                return ''
-
-        csv_rows = TransformStream(transform)
-
         ## Persist csv rows
         self.persist_csv_rows(cur,
                               remote_schema,
@@ -621,20 +1108,83 @@ class PostgresTarget(SQLInterface):
                               csv_headers,
                               csv_rows)
 
-        return len(table_batch['records'])
+        return csv_rows.count
 
-    def add_column(self, cur, table_name, column_name, column_schema):
+    def _transform_stream(self, cur, remote_schema, columns, records):
+        """
+        Make streamable COPY rows for `records`.
+
+        :param cur: Pscyopg.Cursor
+        :param remote_schema: TABLE_SCHEMA(remote)
+        :param columns: [string, ...]
+        :param records: [[...], ...], values ordered like `columns`
+        :return: TransformStream
+        """
+        if self.binary_copy:
+            encoding = extensions.encodings[cur.connection.encoding]
+            encoders = [_binary_copy_encoder(
+                            self.json_schema_to_sql_type(remote_schema['schema']['properties'][column]),
+                            encoding)
+                        for column in columns]
+            return BinaryTransformStream(records, encoders)
+
+        return TransformStream(records)
+
+    def _alter_table(self, cur, table_name, clause):
+        """
+        Run the `ALTER TABLE` `clause` against `table_name`. While upserting a table, the clause is
+        instead queued to be run together with the table's other clauses.
 
+        :param cur: Pscyopg.Cursor
+        :param table_name: string
+        :param clause: psycopg2.sql.Composable
+        :return: None
+        """
+        self._invalidate_table_schema(table_name)
+
+        if self._pending_table_alterations is not None:
+            self._pending_table_alterations.setdefault(table_name, []).append(clause)
+            return None
+
+        self._execute_table_alterations(cur, table_name, [clause])
+
+    def _execute_table_alterations(self, cur, table_name, clauses):
         cur.execute(sql.SQL('''
             ALTER TABLE {table_schema}.{table_name}
-            ADD COLUMN {column_name} {data_type};
+            {clauses};
         ''').format(
             table_schema=sql.Identifier(self.postgres_schema),
             table_name=sql.Identifier(table_name),
+            clauses=sql.SQL(',\n            ').join(clauses)))
+
+    def _flush_table_alterations(self, cur, table_name=None):
+        """
+        Run any queued `ALTER TABLE` clauses for `table_name`, or for all tables when `None`.
+
+        :param cur: Pscyopg.Cursor
+        :param table_name: string
+        :return: None
+        """
+        if not self._pending_table_alterations:
+            return None
+
+        if table_name is None:
+            table_names = sorted(self._pending_table_alterations.keys())
+        else:
+            table_names = [table_name]
+
+        for name in table_names:
+            clauses = self._pending_table_alterations.pop(name, None)
+            if clauses:
+                self._execute_table_alterations(cur, name, clauses)
+
+    def add_column(self, cur, table_name, column_name, column_schema):
+        self._alter_table(cur, table_name, sql.SQL('ADD COLUMN {column_name} {data_type}').format(
             column_name=sql.Identifier(column_name),
             data_type=sql.SQL(self.json_schema_to_sql_type(column_schema))))
 
     def migrate_column(self, cur, table_name, from_column, to_column):
+        self._flush_table_alterations(cur, table_name)
         cur.execute(sql.SQL('''
             UPDATE {table_schema}.{table_name}
             SET {to_column} = {from_column};
@@ -645,39 +1195,33 @@ class PostgresTarget(SQLInterface):
             from_column=sql.Identifier(from_column)))
 
     def drop_column(self, cur, table_name, column_name):
-        cur.execute(sql.SQL('''
-            ALTER TABLE {table_schema}.{table_name}
-            DROP COLUMN {column_name};
-        ''').format(
-            table_schema=sql.Identifier(self.postgres_schema),
-            table_name=sql.Identifier(table_name),
+        self._alter_table(cur, table_name, sql.SQL('DROP COLUMN {column_name}').format(
             column_name=sql.Identifier(column_name)))
 
     def make_column_nullable(self, cur, table_name, column_name):
-        cur.execute(sql.SQL('''
-            ALTER TABLE {table_schema}.{table_name}
-            ALTER COLUMN {column_name} DROP NOT NULL;
-        ''').format(
-            table_schema=sql.Identifier(self.postgres_schema),
-            table_name=sql.Identifier(table_name),
+        self._alter_table(cur, table_name, sql.SQL('ALTER COLUMN {column_name} DROP NOT NULL').format(
             column_name=sql.Identifier(column_name)))
 
-    def add_index(self, cur, table_name, column_names):
-        index_name = 'tp_{}_{}_idx'.format(table_name, "_".join(column_names))
+    def add_index(self, cur, table_name, column_names, unique=False):
+        self._flush_table_alterations(cur, table_name)
+
+        index_name = 'tp_{}_{}_{}'.format(table_name, "_".join(column_names), 'key' if unique else 'idx')
 
         if len(index_name) > self.IDENTIFIER_FIELD_LENGTH:
             index_name_hash = hashlib.sha1(index_name.encode('utf-8')).hexdigest()[0:60]
             index_name = 'tp_{}'.format(index_name_hash)
 
         cur.execute(sql.SQL('''
-            CREATE INDEX {index_name}
+            CREATE {unique}INDEX {index_name}
             ON {table_schema}.{table_name}
             ({column_names});
         ''').format(
+            unique=sql.SQL('UNIQUE ' if unique else ''),
             index_name=sql.Identifier(index_name),
             table_schema=sql.Identifier(self.postgres_schema),
             table_name=sql.Identifier(table_name),
             column_names=sql.SQL(', ').join(sql.Identifier(column_name) for column_name in column_names)))
+        self._catalog_changed = True
 
     def _set_table_metadata(self, cur, table_name, metadata):
         """
@@ -688,12 +1232,57 @@ class PostgresTarget(SQLInterface):
         :param metadata: Metadata Dict
         :return: None
         """
+        raw_json = json.dumps(metadata)
+
+        self._invalidate_table_schema(table_name)
+        self._table_metadata_cache[table_name] = json.loads(raw_json)
+
+        if self._pending_table_metadata is not None:
+            self._pending_table_metadata.add(table_name)
+            return None
+
+        self._write_table_metadata(cur, table_name, raw_json)
+
+    def _write_table_metadata(self, cur, table_name, raw_json):
         cur.execute(sql.SQL('COMMENT ON TABLE {}.{} IS {};').format(
             sql.Identifier(self.postgres_schema),
             sql.Identifier(table_name),
-            sql.Literal(json.dumps(metadata))))
+            sql.Literal(raw_json)))
+
+    def upsert_table_helper(self, cur, schema, metadata, log_schema_changes=True):
+        ## Collect every column and metadata change made while upserting, and apply each changed
+        ## table's columns with one `ALTER TABLE`, and its comment once, at the end
+        self._pending_table_metadata = set()
+        self._pending_table_alterations = {}
+        try:
+            remote_schema = super(PostgresTarget, self).upsert_table_helper(cur,
+                                                                            schema,
+                                                                            metadata,
+                                                                            log_schema_changes=log_schema_changes)
+
+            self._flush_table_alterations(cur)
+
+            for table_name in sorted(self._pending_table_metadata):
+                self._write_table_metadata(cur,
+                                           table_name,
+                                           json.dumps(self._table_metadata_cache[table_name]))
+        finally:
+            self._pending_table_metadata = None
+            self._pending_table_alterations = None
+
+        return remote_schema
 
     def _get_table_metadata(self, cur, table_name):
+        if table_name in self._table_metadata_cache:
+            return deepcopy(self._table_metadata_cache[table_name])
+
+        self._track_table_catalog(cur, table_name)
+        comment_meta = self.__fetch_table_metadata(cur, table_name)
+        self._table_metadata_cache[table_name] = comment_meta
+
+        return deepcopy(comment_meta)
+
+    def __fetch_table_metadata(self, cur, table_name):
         cur.execute(sql.SQL('''
             SELECT EXISTS (
                 SELECT 1 FROM pg_tables
@@ -756,8 +1345,9 @@ class PostgresTarget(SQLInterface):
 
         self._set_table_metadata(cur, table_name, metadata)
 
-    def new_table_indexes(self, schema):
-        if self.add_upsert_indexes:
+    def new_table_indexes(self, schema, metadata):
+        ## The unique index on the key properties already serves the lookups the upsert index is for
+        if self.add_upsert_indexes and not self.new_table_unique_indexes(schema, metadata):
             upsert_index_column_names = deepcopy(schema.get('key_properties', []))
 
             for column_name__or__path in schema['schema']['properties'].keys():
@@ -773,6 +1363,15 @@ class PostgresTarget(SQLInterface):
         else:
             return []
 
+    def new_table_unique_indexes(self, schema, metadata):
+        ## Append only tables are COPYed into directly, so a unique index would reject their duplicate keys
+        if self.merge_strategy == MERGE_STRATEGY_ON_CONFLICT \
+                and schema.get('level') is None \
+                and not metadata.get('append_only'):
+            return [list(map(self.canonicalize_identifier, schema.get('key_properties', [])))]
+        else:
+            return []
+
     def is_table_empty(self, cur, table_name):
         cur.execute(sql.SQL('SELECT EXISTS (SELECT * FROM {}.{});').format(
             sql.Identifier(self.postgres_schema),
@@ -781,7 +1380,16 @@ class PostgresTarget(SQLInterface):
         return not cur.fetchall()[0][0]
 
     def get_table_schema(self, cur, name):
-        return self.__get_table_schema(cur, name)
+        """
+        Cached version of `__get_table_schema`. The returned TABLE_SCHEMA is shared, and must
+        not be mutated by the caller.
+        """
+        if name not in self._table_schema_cache:
+            self._track_table_catalog(cur, name)
+            self._flush_table_alterations(cur, name)
+            self._table_schema_cache[name] = self.__get_table_schema(cur, name)
+
+        return self._table_schema_cache[name]
 
     def __get_table_schema(self, cur, name):
         # Purely exists for migration purposes. DO NOT CALL DIRECTLY
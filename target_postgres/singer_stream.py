@@ -1,12 +1,15 @@
-from copy import deepcopy
+from copy import copy, deepcopy
+import io
 import json
+import pickle
+import sys
+import tempfile
 import uuid
 
 import arrow
-from jsonschema import Draft4Validator, FormatChecker
 from jsonschema.exceptions import ValidationError
 
-from target_postgres import json_schema, singer
+from target_postgres import json_schema, singer, validation
 from target_postgres.exceptions import SingerStreamError
 
 
@@ -21,11 +24,117 @@ SINGER_VALUE = '_sdc_value'
 
 RAW_LINE_SIZE = '__raw_line_size'
 
+VALIDATION_MODE_FULL = 'full'
+VALIDATION_MODE_TYPES_ONLY = 'types_only'
+VALIDATION_MODE_SAMPLE = 'sample'
+VALIDATION_MODE_OFF = 'off'
+VALIDATION_MODES = [VALIDATION_MODE_FULL, VALIDATION_MODE_TYPES_ONLY, VALIDATION_MODE_SAMPLE, VALIDATION_MODE_OFF]
+
 
 def get_line_size(line_data):
     return line_data.get(RAW_LINE_SIZE) or len(json.dumps(line_data))
 
 
+def get_memory_size(value):
+    """
+    Estimate the bytes of memory held by a decoded JSON `value`, ie, by it and everything it contains.
+    Objects referenced more than once are counted every time.
+    :param value: dict, list or scalar
+    :return: int
+    """
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + get_memory_size(item)
+    elif isinstance(value, list):
+        for item in value:
+            size += get_memory_size(item)
+
+    return size
+
+
+def parse_validation_mode(validation_mode):
+    """
+    Given a `validation_mode` setting, return the mode and the number of records per fully validated
+    record.
+    :param validation_mode: string, one of `full`, `types_only`, `sample:<n>` or `off`. Defaults to `full`
+                            when value is None
+    :return: (string, int)
+    """
+    if validation_mode is None:
+        return VALIDATION_MODE_FULL, 1
+
+    mode, _, sample_rate = str(validation_mode).partition(':')
+
+    if mode == VALIDATION_MODE_SAMPLE:
+        try:
+            sample_rate = int(sample_rate)
+        except ValueError:
+            sample_rate = 0
+        if sample_rate > 0:
+            return mode, sample_rate
+    elif mode in VALIDATION_MODES and not sample_rate:
+        return mode, 1
+
+    raise SingerStreamError('Unknown `validation_mode` `{}`. Expected one of `{}`, `{}`, `{}:<n>` or `{}`'.format(
+        validation_mode,
+        VALIDATION_MODE_FULL,
+        VALIDATION_MODE_TYPES_ONLY,
+        VALIDATION_MODE_SAMPLE,
+        VALIDATION_MODE_OFF))
+
+
+class BufferedRecord():
+    """
+    A buffered RECORD message, holding only the record and the message's values batches are built with.
+    Values missing from the message are None, except for the sequence which defaults to the time the record
+    was buffered, so that records without one are ordered by arrival whether they are spilled or not.
+    """
+
+    __slots__ = ('record', 'version', 'time_extracted', 'sequence')
+
+    def __init__(self, record_message):
+        self.record = record_message['record']
+        self.version = record_message.get('version')
+        self.time_extracted = record_message.get('time_extracted')
+        self.sequence = record_message.get('sequence')
+        if self.sequence is None:
+            self.sequence = arrow.get().int_timestamp
+
+
+class SpilledRecords():
+    """
+    Buffered records, the first `records` held in memory and the following `spilled_count` pickled one
+    after another to `spill_file`. Can be iterated any number of times, every iteration reading the spilled
+    records back from the file, and passing them through `transform` when set.
+    """
+
+    def __init__(self, records, spill_file, spilled_count, transform=None):
+        self.records = records
+        self.spill_file = spill_file
+        self.spilled_count = spilled_count
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.records) + self.spilled_count
+
+    def __iter__(self):
+        yield from self.records
+
+        ## Every iteration keeps its own position, so that iterations can be interleaved
+        offset = 0
+        for _ in range(self.spilled_count):
+            self.spill_file.seek(offset)
+            record = pickle.load(self.spill_file)
+            offset = self.spill_file.tell()
+
+            if self.transform is not None:
+                record = self.transform(record)
+
+            yield record
+
+
 class BufferedSingerStream():
     def __init__(self,
                  stream,
@@ -36,11 +145,26 @@ class BufferedSingerStream():
                  invalid_records_threshold=None,
                  max_rows=200000,
                  max_buffer_size=104857600,  # 100MB
+                 validation_mode=None,
+                 memory_accounting=False,
+                 spill_threshold=None,
                  **kwargs):
         """
         :param invalid_records_detect: Defaults to True when value is None
         :param invalid_records_threshold: Defaults to 0 when value is None
+        :param validation_mode: How records are validated, see `parse_validation_mode`. `full` validates every
+                                record against the stream's schema, `types_only` only the JSON types of its values,
+                                `sample:<n>` fully validates one in every `n` records and `off` none. Records found
+                                invalid are handled as per `invalid_records_detect` and `invalid_records_threshold`
+                                in every mode.
+        :param memory_accounting: Whether `max_buffer_size` applies to the estimated memory held by buffered
+                                  records, instead of the size of their raw lines
+        :param spill_threshold: When set, records added once the buffer's size is at least `spill_threshold` are
+                                written to a temporary file instead of being held in memory, and do not count
+                                towards the buffer's size. Batches are then only bounded by `max_rows`.
         """
+        self.validation_mode, self.validation_sample_rate = parse_validation_mode(validation_mode)
+
         self.schema = None
         self.key_properties = None
         self.validator = None
@@ -50,6 +174,8 @@ class BufferedSingerStream():
         self.invalid_records = []
         self.max_rows = max_rows
         self.max_buffer_size = max_buffer_size
+        self.memory_accounting = memory_accounting
+        self.spill_threshold = spill_threshold
 
         self.invalid_records_detect = invalid_records_detect
         self.invalid_records_threshold = invalid_records_threshold
@@ -63,14 +189,24 @@ class BufferedSingerStream():
         self.__count = 0
         self.__size = 0
         self.__lifetime_max_version = None
+        self.__unsampled_records = 0
+        self.__spill_file = None
+        self.__spilled_count = 0
 
     def update_schema(self, schema, key_properties):
         # In order to determine whether a value _is in_ properties _or not_ we need to flatten `$ref`s etc.
         self.schema = json_schema.simplify(schema)
         self.key_properties = deepcopy(key_properties)
 
-        # The validator can handle _many_ more things than our simplified schema, and is, in general handled by third party code
-        self.validator = Draft4Validator(schema, format_checker=FormatChecker())
+        # The validator can handle _many_ more things than our simplified schema. Validators are shared by streams
+        # with equal schemas, so taps re-sending the same SCHEMA do not rebuild them
+        if self.validation_mode == VALIDATION_MODE_TYPES_ONLY:
+            self.validator = validation.get_validator(validation.types_only_schema(self.schema))
+        elif self.validation_mode != VALIDATION_MODE_OFF:
+            self.validator = validation.get_validator(schema)
+
+        # Numbers of records need decoding as `Decimal`s when they are validated against `multipleOf`
+        self.requires_decimals = self.validator is not None and validation.requires_decimals(self.validator.schema)
 
         properties = self.schema['properties']
 
@@ -109,6 +245,10 @@ class BufferedSingerStream():
     def count(self):
         return self.__count
 
+    @property
+    def size(self):
+        return self.__size
+
     @property
     def buffer_full(self):
         if self.__count >= self.max_rows:
@@ -133,6 +273,17 @@ class BufferedSingerStream():
         self.flush_buffer()
         self.__lifetime_max_version = version
 
+    def __should_validate(self):
+        if self.validation_mode == VALIDATION_MODE_OFF:
+            return False
+
+        if self.validation_mode == VALIDATION_MODE_SAMPLE:
+            unsampled_records = self.__unsampled_records
+            self.__unsampled_records = (unsampled_records + 1) % self.validation_sample_rate
+            return unsampled_records == 0
+
+        return True
+
     def add_record_message(self, record_message):
         add_record = True
 
@@ -141,15 +292,23 @@ class BufferedSingerStream():
         if self.__lifetime_max_version != record_message.get('version'):
             return None
 
-        try:
-            self.validator.validate(record_message['record'])
-        except ValidationError as error:
-            add_record = False
-            self.invalid_records.append((error, record_message))
+        if self.__should_validate():
+            try:
+                self.validator.validate(record_message['record'])
+            except ValidationError as error:
+                add_record = False
+                self.invalid_records.append((error, record_message))
 
         if add_record:
-            self.__buffer.append(record_message)
-            self.__size += get_line_size(record_message)
+            buffered_record = BufferedRecord(record_message)
+            if self.spill_threshold is not None and self.__size >= self.spill_threshold:
+                self.__spill(buffered_record)
+            else:
+                self.__buffer.append(buffered_record)
+                if self.memory_accounting:
+                    self.__size += sys.getsizeof(buffered_record) + get_memory_size(buffered_record.record)
+                else:
+                    self.__size += get_line_size(record_message)
             self.__count += 1
         elif self.invalid_records_detect \
                 and len(self.invalid_records) >= self.invalid_records_threshold:
@@ -158,33 +317,56 @@ class BufferedSingerStream():
                     self.invalid_records_threshold),
                 self.invalid_records)
 
+    def __spill(self, buffered_record):
+        if self.__spill_file is None:
+            self.__spill_file = tempfile.TemporaryFile()
+
+        ## Spilled records are read back once per table written, so everything `get_batch` would
+        ## generate for them has to be fixed beforehand
+        record = buffered_record.record
+        if self.use_uuid_pk and record.get(singer.PK) is None:
+            record[singer.PK] = str(uuid.uuid4())
+
+        self.__spill_file.seek(0, io.SEEK_END)
+        pickle.dump(buffered_record, self.__spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__spilled_count += 1
+
     def peek_buffer(self):
+        if self.__spilled_count:
+            return SpilledRecords(self.__buffer, self.__spill_file, self.__spilled_count)
+
         return self.__buffer
 
-    def get_batch(self):
-        current_time = arrow.get().format('YYYY-MM-DD HH:mm:ss.SSSSZZ')
+    def __batch_record(self, buffered_record, current_time):
+        record = buffered_record.record
 
-        records = []
-        for record_message in self.peek_buffer():
-            record = record_message['record']
+        if buffered_record.version is not None:
+            record[singer.TABLE_VERSION] = buffered_record.version
 
-            if 'version' in record_message:
-                record[singer.TABLE_VERSION] = record_message['version']
+        if buffered_record.time_extracted is not None and record.get(singer.RECEIVED_AT) is None:
+            record[singer.RECEIVED_AT] = buffered_record.time_extracted
 
-            if 'time_extracted' in record_message and record.get(singer.RECEIVED_AT) is None:
-                record[singer.RECEIVED_AT] = record_message['time_extracted']
+        if self.use_uuid_pk and record.get(singer.PK) is None:
+            record[singer.PK] = str(uuid.uuid4())
 
-            if self.use_uuid_pk and record.get(singer.PK) is None:
-                record[singer.PK] = str(uuid.uuid4())
+        record[singer.BATCHED_AT] = current_time
 
-            record[singer.BATCHED_AT] = current_time
+        record[singer.SEQUENCE] = buffered_record.sequence
 
-            if 'sequence' in record_message:
-                record[singer.SEQUENCE] = record_message['sequence']
-            else:
-                record[singer.SEQUENCE] = arrow.get().int_timestamp
+        return record
+
+    def get_batch(self):
+        current_time = arrow.get().format('YYYY-MM-DD HH:mm:ss.SSSSZZ')
 
-            records.append(record)
+        records = []
+        for buffered_record in self.__buffer:
+            records.append(self.__batch_record(buffered_record, current_time))
+
+        if self.__spilled_count:
+            return SpilledRecords(records,
+                                  self.__spill_file,
+                                  self.__spilled_count,
+                                  transform=lambda buffered_record: self.__batch_record(buffered_record, current_time))
 
         return records
 
@@ -193,7 +375,24 @@ class BufferedSingerStream():
         self.__buffer = []
         self.__size = 0
         self.__count = 0
+
+        if self.__spill_file is not None:
+            self.__spill_file.close()
+        self.__spill_file = None
+        self.__spilled_count = 0
         return _buffer
 
+    def detach_buffer(self):
+        """
+        Move the buffered records into a copy of this stream, leaving this stream's buffer empty.
+        :return: BufferedSingerStream holding the detached records, along with the schema and
+                 key_properties they were buffered under
+        """
+        detached = copy(self)
+        ## The spill file now belongs to the detached copy, which closes it once flushed
+        self.__spill_file = None
+        self.flush_buffer()
+        return detached
+
     def peek_invalid_records(self):
         return self.invalid_records
@@ -13,8 +13,7 @@
 #
 
 from copy import deepcopy
-from functools import lru_cache, partial
-import pickle
+import json
 import time
 
 import singer
@@ -35,6 +34,23 @@ def _mapping_name(field, schema):
     return field + SEPARATOR + json_schema.shorthand(schema)
 
 
+def _table_schema_fingerprint(schema):
+    """
+    Given a TABLE_SCHEMA(local), return a hashable fingerprint of everything `upsert_table_helper`
+    reconciles against the remote. Non-JSON values, such as Decimal defaults, are serialized with `str`.
+
+    :param schema: TABLE_SCHEMA(local)
+    :return: string
+    """
+    return json.dumps({
+        'path': list(schema['path']),
+        'key_properties': schema.get('key_properties'),
+        'properties': sorted([list(column_path), column_schema]
+                             for column_path, column_schema in schema['schema']['properties'].items())},
+        sort_keys=True,
+        default=str)
+
+
 class SQLInterface:
     """
     Generic interface for handling SQL Targets in Singer.
@@ -261,6 +277,16 @@ class SQLInterface:
 
         return {'exists': False, 'to': canonicalized_name}
 
+    def upserted_table_schemas(self):
+        """
+        Returns the dict of `{table_name: (fingerprint, TABLE_SCHEMA(remote))}` which `upsert_table_helper` uses to
+        skip tables whose streamed schema and remote schema have not changed since they were last upserted.
+        For subclasses which do not cache remote schemas, this can safely always return a new empty dict.
+
+        :return: dict
+        """
+        return {}
+
     def add_table_mapping(self, connection, from_path, metadata):
         """
         Given a full path to a table, `from_path`, add a table mapping to the canonicalized name.
@@ -317,13 +343,14 @@ class SQLInterface:
         """
         raise NotImplementedError('`make_column_nullable` not implemented.')
 
-    def add_index(self, connection, table_name, column_names):
+    def add_index(self, connection, table_name, column_names, unique=False):
         """
         Add an index on a group of `column_names` in `table_name`.
 
         :param connection: remote connection, type left to be determined by implementing class
         :param table_name: string
         :param column_names: (string, ...)
+        :param unique: boolean, whether the index should enforce uniqueness
         :return: None
         """
         raise NotImplementedError('`add_index` not implemented.')
@@ -397,6 +424,15 @@ class SQLInterface:
 
             existing_schema = self._get_table_schema(connection, table_name)
 
+            ## Neither the streamed schema nor the remote have changed since we last upserted
+            ## this table, so there is nothing to reconcile
+            upserted_table_schemas = self.upserted_table_schemas()
+            fingerprint = _table_schema_fingerprint(schema)
+
+            if existing_schema is not None \
+                    and upserted_table_schemas.get(table_name) == (fingerprint, existing_schema):
+                return existing_schema
+
             existing_table = True
             if existing_schema is None:
                 self.add_table(connection, table_path, table_name, _metadata)
@@ -625,10 +661,15 @@ class SQLInterface:
                 log_message(upsert_table_helper__column)
 
             if not existing_table:
-                for column_names in self.new_table_indexes(schema):
+                for column_names in self.new_table_indexes(schema, _metadata):
                     self.add_index(connection, table_name, column_names)
+                for column_names in self.new_table_unique_indexes(schema, _metadata):
+                    self.add_index(connection, table_name, column_names, unique=True)
 
-            return self._get_table_schema(connection, table_name)
+            remote_schema = self._get_table_schema(connection, table_name)
+            upserted_table_schemas[table_name] = (fingerprint, remote_schema)
+
+            return remote_schema
 
     def _serialize_table_record_field_name(self, remote_schema, path, value_json_schema_tuple):
         """
@@ -701,82 +742,134 @@ class SQLInterface:
 
         raise NotImplementedError('`parse_table_record_serialize_datetime_value` not implemented.')
 
-    def _serialize_table_records(
-            self, remote_schema, streamed_schema, records):
+    def _compile_table_record_serializer(self, remote_schema, streamed_schema):
         """
-        Parse the given table's `records` in preparation for persistence to the remote target.
+        Build a function which serializes a record of the table described by `streamed_schema` into
+        a row for `remote_schema`, in a single pass over the table's columns. Rows are lists with
+        one value per property of `remote_schema`, in the same order.
 
-        Base implementation returns a list of dictionaries, where _every_ dictionary has the
-        same keys as `remote_schema`'s properties.
+        Everything which only depends on the schemas is worked out here, once per table batch:
+        each column's path, whether it holds date-times and its default value. The position of the
+        remote field, and whether the value needs date-time serialization, are worked out the first
+        time each Python type is seen for a column, and reused for every following record.
 
         :param remote_schema: TABLE_SCHEMA(remote)
         :param streamed_schema: TABLE_SCHEMA(local)
-        :param records: [{(path_0, path_1, ...): (_json_schema_string_type, value), ...}, ...]
-        :return: [{...}, ...]
+        :return: function({...}, {'_sdc_*': value, ...}) -> [...]
         """
 
-        datetime_paths = set()
-        default_paths = {}
-
-        for column_path, column_schema in streamed_schema['schema']['properties'].items():
-            for sub_schema in column_schema['anyOf']:
-                if json_schema.is_datetime(sub_schema):
-                    datetime_paths.add(column_path)
-                if sub_schema.get('default') is not None:
-                    default_paths[column_path] = sub_schema.get('default')
-
         ## Get the default NULL value so we can assign row values when value is _not_ NULL
         NULL_DEFAULT = self.serialize_table_record_null_value(remote_schema, streamed_schema, None, None)
 
-        serialized_rows = []
+        field_indexes = {field: i for i, field in enumerate(remote_schema['schema']['properties'].keys())}
+        default_row = [NULL_DEFAULT] * len(field_indexes)
 
-        remote_fields = set(remote_schema['schema']['properties'].keys())
-        default_row = dict([(field, NULL_DEFAULT) for field in remote_fields])
+        serialize_null_value = self.serialize_table_record_null_value
+        serialize_datetime_value = self.serialize_table_record_datetime_value
 
-        paths = streamed_schema['schema']['properties'].keys()
+        def field_for(path, datetime_path, value):
+            ## Objects and arrays are denested into other columns and tables
+            if isinstance(value, (dict, list)):
+                return None
 
-        ## create a partial function with only hashable args so we can use lru_cache on it
-        _cached_field_name = partial(self._serialize_table_record_field_name, remote_schema)
-        cached_field_name = lru_cache(maxsize=None)(_cached_field_name)
+            json_schema_string_type = json_schema.python_type(value)
 
-        for record in records:
+            ## Serialize datetime to compatible format
+            if datetime_path and json_schema_string_type == json_schema.STRING:
+                return (field_indexes[self._serialize_table_record_field_name(
+                            remote_schema,
+                            path,
+                            (json_schema.STRING, json_schema.DATE_TIME_FORMAT))],
+                        True)
 
-            ## pickling/unpickling is much faster than deepcopy
-            row = pickle.loads(pickle.dumps(default_row))
+            return (field_indexes[self._serialize_table_record_field_name(remote_schema,
+                                                                          path,
+                                                                          (json_schema_string_type,))],
+                    False)
 
-            for path in paths:
-                json_schema_string_type, value = record.get(path, (None, None))
+        columns = []
+        for path, column_schema in streamed_schema['schema']['properties'].items():
+            datetime_path = False
+            default = None
+            for sub_schema in column_schema['anyOf']:
+                if json_schema.is_datetime(sub_schema):
+                    datetime_path = True
+                if sub_schema.get('default') is not None:
+                    default = sub_schema.get('default')
+
+            ## (path, top level property, is date-time, default, {python type: (field index, is date-time) | None})
+            columns.append((path, path[0] if len(path) == 1 else None, datetime_path, default, {}))
+
+        def serialize(record, pk_fks):
+            row = default_row.copy()
+
+            for path, prop, datetime_path, default, fields in columns:
+                if prop is None:
+                    value = record
+                    for key in path:
+                        if not isinstance(value, dict):
+                            value = None
+                            break
+                        value = value.get(key)
+                elif pk_fks and prop in pk_fks:
+                    value = pk_fks[prop]
+                else:
+                    value = record.get(prop)
+
+                field = None
+                if value is not None:
+                    value_type = type(value)
+                    if value_type in fields:
+                        field = fields[value_type]
+                    else:
+                        field = fields[value_type] = field_for(path, datetime_path, value)
 
                 ## Serialize fields which are not present but have default values set
-                if path in default_paths \
-                        and value is None:
-                    value = default_paths[path]
-                    json_schema_string_type = json_schema.python_type(value)
+                if field is None:
+                    if default is None:
+                        continue
+                    value = default
+                    value_type = type(value)
+                    if value_type in fields:
+                        field = fields[value_type]
+                    else:
+                        field = fields[value_type] = field_for(path, datetime_path, value)
+                    if field is None:
+                        continue
+
+                field_index, datetime_value = field
+                if datetime_value:
+                    value = serialize_datetime_value(remote_schema, streamed_schema, path, value)
 
-                if not json_schema_string_type:
-                    continue
+                ## Serialize NULL default value
+                value = serialize_null_value(remote_schema, streamed_schema, path, value)
 
-                ## Serialize datetime to compatible format
-                if path in datetime_paths \
-                        and json_schema_string_type == json_schema.STRING \
-                        and value is not None:
-                    value = self.serialize_table_record_datetime_value(remote_schema, streamed_schema, path,
-                                                                       value)
-                    value_json_schema_tuple = (json_schema.STRING, json_schema.DATE_TIME_FORMAT)
-                    field_name = cached_field_name(path, value_json_schema_tuple)
-                else:
-                    field_name = cached_field_name(path, (json_schema_string_type,))
+                ## Field is unset
+                if row[field_index] == NULL_DEFAULT:
+                    row[field_index] = value
 
-                ## Serialize NULL default value
-                value = self.serialize_table_record_null_value(remote_schema, streamed_schema, path, value)
+            return row
+
+        return serialize
+
+    def _serialize_table_records(
+            self, remote_schema, streamed_schema, records):
+        """
+        Parse the given table's `records` in preparation for persistence to the remote target.
 
-                ## `field_name` is unset
-                if row[field_name] == NULL_DEFAULT:
-                    row[field_name] = value
+        Base implementation yields lists, where _every_ list holds one value for each of
+        `remote_schema`'s properties, in the same order. `records` are only consumed as rows are
+        requested.
 
-            serialized_rows.append(row)
+        :param remote_schema: TABLE_SCHEMA(remote)
+        :param streamed_schema: TABLE_SCHEMA(local)
+        :param records: iterable of ({...}, {'_sdc_*': value, ...}), see `denest.iter_table_batches`
+        :return: generator of [...]
+        """
+        serialize = self._compile_table_record_serializer(remote_schema, streamed_schema)
 
-        return serialized_rows
+        for record, pk_fks in records:
+            yield serialize(record, pk_fks)
 
     def write_table_batch(self, connection, table_batch, metadata):
         """
@@ -785,7 +878,7 @@ class SQLInterface:
 
         :param connection: remote connection, type left to be determined by implementing class
         :param table_batch: {'remote_schema': TABLE_SCHEMA(remote),
-                             'records': [{...}, ...]}
+                             'records': iterable of [...], see `_serialize_table_records`}
         :param metadata: additional metadata needed by implementing class
         :return: integer
         """
@@ -816,7 +909,7 @@ class SQLInterface:
                     key_properties
                 ))
 
-                for table_batch in denest.to_table_batches(schema, key_properties, records):
+                for table_batch in denest.iter_table_batches(schema, key_properties, records, flatten=False):
                     table_batch['streamed_schema']['path'] = (root_table_name,) + \
                                                              table_batch['streamed_schema']['path']
 
@@ -837,8 +930,7 @@ class SQLInterface:
                             self._set_metrics_tags__table(table_batch_timer, remote_schema['name'])
                             self._set_metrics_tags__table(table_batch_counter, remote_schema['name'])
 
-                            self.LOGGER.info('Writing table batch with {} rows for `{}`...'.format(
-                                len(table_batch['records']),
+                            self.LOGGER.info('Writing table batch for `{}`...'.format(
                                 table_batch['streamed_schema']['path']
                             ))
 
@@ -878,14 +970,24 @@ class SQLInterface:
         """
         raise NotImplementedError('`activate_version` not implemented.')
 
-    def new_table_indexes(self, schema):
+    def new_table_indexes(self, schema, metadata):
         """
         Returns a list of lists of string column names to add indexes for a new table once that new table has been fully created.
         For subclassess where indexes don't make any sense, like Redshift, this can safely always return false.
 
         :param schema: TABLE_SCHEMA(local)
-        :param column_name: string
+        :param metadata: additional metadata passed to `upsert_table_helper`
         :return: [[column_name: string], [column_name: string, column_name: string],...]
         """
         return []
 
+    def new_table_unique_indexes(self, schema, metadata):
+        """
+        Returns a list of lists of string column names to add unique indexes for a new table once that new table has been fully created.
+        For subclasses which do not merge using unique indexes, this can safely always return an empty list.
+
+        :param schema: TABLE_SCHEMA(local)
+        :param metadata: additional metadata passed to `upsert_table_helper`
+        :return: [[column_name: string], [column_name: string, column_name: string],...]
+        """
+        return []
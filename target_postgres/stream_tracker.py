@@ -1,10 +1,39 @@
 from collections import deque
 import json
+import os
+import queue
+import singer
 import singer.statediff as statediff
 import sys
+import threading
+import time
 
+from target_postgres.batch_sizing import AdaptiveBatchSize
 from target_postgres.exceptions import TargetError
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+LOGGER = singer.get_logger()
+
+
+def get_rss():
+    """
+    :return: int, the resident set size of this process in bytes, or None when it cannot be measured
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    return None
+
 
 class StreamTracker:
     """
@@ -14,11 +43,38 @@ class StreamTracker:
     emit a STATE message once all the records that came in prior to that STATE in the stream. Because target-postgres buffers
     the records in BufferedSingerStreams, the STATE messages need to be delayed until all the records that came before them have been
     saved to the database from their buffers.
+
+    When `max_pending_batches` is positive, full buffers are detached and handed to a background writer thread through
+    a queue holding at most that many batches, so that reading can carry on while the database writes. A stream's flush
+    watermark only advances once the writer has finished its batch, so STATE messages are still only emitted after the
+    records before them have been saved.
+
+    `writer_targets` are additional targets, each with its own connection, which get a writer thread of their own. Each
+    stream is assigned to a single writer when its first batch is queued, so batches of a stream are written in order
+    while different streams are written concurrently.
+
+    When `max_memory` is set, the resident set size of the process is checked whenever streams are checked for being
+    full. Once it is at least `max_memory` bytes, every stream holding records is flushed. As freed memory is seldom
+    returned to the OS, the resident set size usually stays over `max_memory` afterwards, so streams are only flushed
+    again once their combined size is back at what was flushed, or once it drops under `max_memory`.
+
+    When `max_buffer_size` is set, it bounds the combined size of all streams' buffers. Once they are over it, the
+    largest buffers are flushed first until the rest fit, so that many small streams do not force the few large ones
+    into small batches.
+
+    When `batch_rows` is set to `(min_rows, max_rows)`, the `max_rows` of every stream is tuned from how long its
+    batches take to write and how large their buffers get, see `AdaptiveBatchSize`.
     """
 
-    def __init__(self, target, emit_states):
+    def __init__(self, target, emit_states, max_pending_batches=0, writer_targets=None, max_memory=None,
+                 max_buffer_size=None, batch_rows=None):
         self.target = target
         self.emit_states = emit_states
+        self.max_memory = max_memory
+        self.memory_flushed_size = None  # combined size of the buffers flushed since `max_memory` was reached
+        self.max_buffer_size = max_buffer_size
+        self.batch_rows = batch_rows
+        self.batch_sizes = {}  # dict of {'<stream_name>': AdaptiveBatchSize}, when `batch_rows` is set
 
         self.streams = {}
 
@@ -33,21 +89,114 @@ class StreamTracker:
         self.message_counter = 0
         self.last_emitted_state = None
 
+        self.pending_batches = []  # one queue per writer thread
+        self.stream_pending_batches = {}  # dict of {'<stream_name>': <queue of the writer assigned to the stream>}
+        self.written_batches = deque()  # contains tuples of (<stream_name>, watermark, rows, seconds, size) for batches the writers have saved
+        self.writer_error = None
+        self.writers = []
+
+        writer_targets = [target] + list(writer_targets or [])
+        if len(writer_targets) > 1:
+            max_pending_batches = max(max_pending_batches, 1)
+
+        if max_pending_batches:
+            for i, writer_target in enumerate(writer_targets):
+                pending_batches = queue.Queue(maxsize=max_pending_batches)
+                writer = threading.Thread(target=self._write_pending_batches,
+                                          args=(writer_target, pending_batches),
+                                          name='target-postgres-writer-{}'.format(i),
+                                          daemon=True)
+                writer.start()
+                self.pending_batches.append(pending_batches)
+                self.writers.append(writer)
+
     def register_stream(self, stream, buffered_stream):
         self.streams[stream] = buffered_stream
         self.stream_flush_watermarks[stream] = 0
 
+        if self.batch_rows:
+            ## Streams registered again, eg, for a new SCHEMA, keep the size tuned so far
+            batch_size = self.batch_sizes.setdefault(stream, AdaptiveBatchSize(*self.batch_rows))
+            buffered_stream.max_rows = batch_size.rows
+
     def flush_stream(self, stream):
         self._write_batch_and_update_watermarks(stream)
+        self._wait_for_pending_batches()
         self._emit_safe_queued_states()
 
     def flush_streams(self, force=False):
+        memory_full = not force and self._memory_full()
+
         for (stream, stream_buffer) in self.streams.items():
-            if force or stream_buffer.buffer_full:
+            if force or stream_buffer.buffer_full or (memory_full and stream_buffer.count > 0):
                 self._write_batch_and_update_watermarks(stream)
 
+        if not force and self.max_buffer_size:
+            self._flush_largest_streams()
+
+        if force:
+            self._wait_for_pending_batches()
         self._emit_safe_queued_states(force=force)
 
+    def _flush_largest_streams(self):
+        buffer_size = sum(stream_buffer.size for stream_buffer in self.streams.values())
+        if buffer_size <= self.max_buffer_size:
+            return None
+
+        for stream, stream_buffer in sorted(self.streams.items(), key=lambda item: item[1].size, reverse=True):
+            if buffer_size <= self.max_buffer_size or stream_buffer.count == 0:
+                break
+
+            buffer_size -= stream_buffer.size
+            self._write_batch_and_update_watermarks(stream)
+
+    def _memory_full(self):
+        if not self.max_memory:
+            return False
+
+        rss = get_rss()
+        if rss is None:
+            LOGGER.warning('Unable to measure the memory used by the Target, `max_memory` is ignored')
+            self.max_memory = None
+            return False
+
+        if rss < self.max_memory:
+            self.memory_flushed_size = None
+            return False
+
+        ## Until the buffers are back at the size flushed last, they fit into the memory that flush freed
+        buffer_size = sum(stream_buffer.size for stream_buffer in self.streams.values())
+        if buffer_size == 0 or (self.memory_flushed_size is not None and buffer_size < self.memory_flushed_size):
+            return False
+
+        LOGGER.info('Target is using {} bytes of memory, flushing all buffered records'.format(rss))
+        self.memory_flushed_size = buffer_size
+        return True
+
+    def close(self):
+        """
+        Stop the background writers, if any. Batches still waiting in the queue are discarded, which only
+        happens when the target is stopping because of an error.
+        """
+        if not self.writers:
+            return None
+
+        self.writer_error = self.writer_error or TargetError('Stream tracker closed')
+        for pending_batches in self.pending_batches:
+            while True:
+                try:
+                    pending = pending_batches.get_nowait()
+                    if pending is not None:
+                        pending[1].flush_buffer()
+                    pending_batches.task_done()
+                except queue.Empty:
+                    break
+            pending_batches.put(None)
+
+        for writer in self.writers:
+            writer.join()
+        self.writers = []
+
     def handle_state_message(self, line):
         if self.emit_states:
             self.state_queue.append({'state': line, 'watermark': self.message_counter})
@@ -64,11 +213,77 @@ class StreamTracker:
 
     def _write_batch_and_update_watermarks(self, stream):
         stream_buffer = self.streams[stream]
-        self.target.write_batch(stream_buffer)
-        stream_buffer.flush_buffer()
-        self.stream_flush_watermarks[stream] = self.stream_add_watermarks.get(stream, 0)
+        watermark = self.stream_add_watermarks.get(stream, 0)
+
+        if not self.writers:
+            rows = stream_buffer.count
+            size = stream_buffer.size
+            started = time.monotonic()
+            self.target.write_batch(stream_buffer)
+            self._batch_written(stream, rows, time.monotonic() - started, size)
+            stream_buffer.flush_buffer()
+            self.stream_flush_watermarks[stream] = watermark
+            return None
+
+        self._collect_written_batches()
+
+        if stream not in self.stream_pending_batches:
+            self.stream_pending_batches[stream] = \
+                self.pending_batches[len(self.stream_pending_batches) % len(self.pending_batches)]
+
+        # Blocks while the queue is full, which bounds the number of batches held in memory
+        self.stream_pending_batches[stream].put((stream, stream_buffer.detach_buffer(), watermark))
+
+    def _write_pending_batches(self, target, pending_batches):
+        while True:
+            pending = pending_batches.get()
+            try:
+                if pending is None:
+                    return None
+
+                stream, stream_buffer, watermark = pending
+                if self.writer_error is None:
+                    rows, size = stream_buffer.count, stream_buffer.size
+                    started = time.monotonic()
+                    target.write_batch(stream_buffer)
+                    self.written_batches.append((stream, watermark, rows, time.monotonic() - started, size))
+            except Exception as ex:
+                self.writer_error = ex
+            finally:
+                ## Detached buffers are only referenced here, flushing them closes their spill files
+                if pending is not None:
+                    pending[1].flush_buffer()
+                pending_batches.task_done()
+
+    def _wait_for_pending_batches(self):
+        for pending_batches in self.pending_batches:
+            pending_batches.join()
+        self._collect_written_batches()
+
+    def _collect_written_batches(self):
+        if self.writer_error is not None:
+            raise self.writer_error
+
+        # A stream's batches are written in the order they were queued, so its watermark only ever moves forward
+        while self.written_batches:
+            stream, watermark, rows, seconds, size = self.written_batches.popleft()
+            self.stream_flush_watermarks[stream] = watermark
+            self._batch_written(stream, rows, seconds, size)
+
+    def _batch_written(self, stream, rows, seconds, size):
+        batch_size = self.batch_sizes.get(stream)
+        if batch_size is None:
+            return None
+
+        max_rows = batch_size.batch_written(rows, seconds, size)
+        if max_rows != self.streams[stream].max_rows:
+            LOGGER.info('Batches of `{}` took {:.2f}s for {} rows, now buffering up to {} rows'.format(
+                stream, seconds, rows, max_rows))
+            self.streams[stream].max_rows = max_rows
 
     def _emit_safe_queued_states(self, force=False):
+        self._collect_written_batches()
+
         # State messages that occured before the least recently flushed record are safe to emit.
         # If they occurred after some records that haven't yet been flushed, they aren't safe to emit.
         # Because records arrive at different rates from different streams, we take the earliest unflushed record
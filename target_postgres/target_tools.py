@@ -2,6 +2,7 @@ import http.client
 import io
 import json
 import pkg_resources
+import re
 import sys
 import threading
 import decimal
@@ -14,34 +15,98 @@ from target_postgres.exceptions import TargetError
 from target_postgres.singer_stream import BufferedSingerStream, RAW_LINE_SIZE
 from target_postgres.stream_tracker import StreamTracker
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 LOGGER = singer.get_logger()
 
+STDIN_BUFFER_SIZE = 1048576  # 1MB
+
+## The `type` and `stream` which RECORD lines start with
+_RECORD_PREFIX = re.compile(r'\s*\{\s*"type"\s*:\s*"RECORD"\s*,\s*"stream"\s*:\s*"((?:[^"\\]|\\.)*)"\s*,')
+## The top level `version` which RECORD lines end with, optionally followed by other scalar properties,
+## ie, `..., "version": 123, "time_extracted": "..."}`
+_RECORD_VERSION_SUFFIX = re.compile(
+    r',\s*"version"\s*:\s*(-?\d+)\s*'
+    r'(?:,\s*"\w+"\s*:\s*(?:"[^"\\]*"|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)\s*)*'
+    r'\}\s*$')
+_RECORD_VERSION_SUFFIX_LENGTH = 256
+_RECORD_PATTERNS = {str: (_RECORD_PREFIX, _RECORD_VERSION_SUFFIX),
+                    bytes: (re.compile(_RECORD_PREFIX.pattern.encode('utf-8')),
+                            re.compile(_RECORD_VERSION_SUFFIX.pattern.encode('utf-8')))}
+
+
+def _decode_json_decimal(line):
+    """
+    Decode `line`, with numbers which are not integers decoded as `Decimal`s.
+    :param line: string
+    :return: {...}
+    """
+    return json.loads(line, parse_float=decimal.Decimal)
+
 
-def main(target):
+def _decode_json_float(line):
     """
-    Given a target, stream stdin input as a text stream.
+    Decode `line`, with numbers which are not integers decoded as `float`s. Uses `orjson` when installed,
+    falling back to the standard library for what it rejects, like `NaN`s or numbers out of range.
+    :param line: string
+    :return: {...}
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(line)
+
+
+def main(target, writer_targets=None):
+    """
+    Given a target, stream stdin input as lines of bytes, read in blocks of `STDIN_BUFFER_SIZE`.
     :param target: object which implements `write_batch` and `activate_version`
+    :param writer_targets: [optional] additional targets to write batches of different streams concurrently
     :return: None
     """
     config = utils.parse_args([]).config
-    input_stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
-    stream_to_target(input_stream, target, config=config)
+    input_stream = io.BufferedReader(sys.stdin.buffer.raw, buffer_size=STDIN_BUFFER_SIZE)
+    stream_to_target(input_stream, target, config=config, writer_targets=writer_targets)
 
     return None
 
 
-def stream_to_target(stream, target, config={}):
+def stream_to_target(stream, target, config={}, writer_targets=None):
     """
     Persist `stream` to `target` with optional `config`.
-    :param stream: iterator which represents a Singer data stream
+    :param stream: iterator which represents a Singer data stream, of lines as UTF-8 bytes or strings
     :param target: object which implements `write_batch` and `activate_version`
     :param config: [optional] configuration for buffers etc.
+    :param writer_targets: [optional] additional targets, each with its own connection, used to write batches of
+                           different streams concurrently
     :return: None
     """
 
     state_support = config.get('state_support', True)
-    state_tracker = StreamTracker(target, state_support)
-    _run_sql_hook('before_run_sql', config, target)
+    max_pending_batches = config.get('max_pending_batches', 0)
+    max_memory = config.get('max_memory')
+    max_total_buffer_size = config.get('max_total_buffer_size')
+    max_batch_rows = config.get('max_batch_rows', 200000)
+    min_batch_rows = max_batch_rows
+    batch_rows = None
+    if config.get('adaptive_batch_rows', False):
+        min_batch_rows = min(config.get('min_batch_rows', 1000), max_batch_rows)
+        batch_rows = (min_batch_rows, max_batch_rows)
+    for hooked_target in [target] + list(writer_targets or []):
+        _run_sql_hook('before_run_sql', config, hooked_target, table_connections=True)
+    state_tracker = StreamTracker(target,
+                                  state_support,
+                                  max_pending_batches=max_pending_batches,
+                                  writer_targets=writer_targets,
+                                  max_memory=max_memory,
+                                  max_buffer_size=max_total_buffer_size,
+                                  batch_rows=batch_rows)
 
     try:
         if not config.get('disable_collection', False):
@@ -49,9 +114,12 @@ def stream_to_target(stream, target, config={}):
 
         invalid_records_detect = config.get('invalid_records_detect')
         invalid_records_threshold = config.get('invalid_records_threshold')
-        max_batch_rows = config.get('max_batch_rows', 200000)
+        validation_mode = config.get('validation_mode')
+        memory_accounting = config.get('memory_accounting', False)
+        spill_threshold = config.get('spill_threshold')
         max_batch_size = config.get('max_batch_size', 104857600)  # 100MB
-        batch_detection_threshold = config.get('batch_detection_threshold', max(max_batch_rows / 40, 50))
+        ## Adaptive batches start at `min_batch_rows`, so check for full buffers often enough to notice them
+        batch_detection_threshold = config.get('batch_detection_threshold', max(min_batch_rows / 40, 50))
 
         line_count = 0
         for line in stream:
@@ -59,6 +127,9 @@ def stream_to_target(stream, target, config={}):
                           target,
                           invalid_records_detect,
                           invalid_records_threshold,
+                          validation_mode,
+                          memory_accounting,
+                          spill_threshold,
                           max_batch_rows,
                           max_batch_size,
                           line
@@ -76,6 +147,7 @@ def stream_to_target(stream, target, config={}):
         LOGGER.critical(e)
         raise e
     finally:
+        state_tracker.close()
         _report_invalid_records(state_tracker.streams)
 
 
@@ -88,10 +160,106 @@ def _report_invalid_records(streams):
             ))
 
 
-def _line_handler(state_tracker, target, invalid_records_detect, invalid_records_threshold, max_batch_rows,
-                  max_batch_size, line):
+def _line_size(line):
+    """
+    :param line: bytes or string
+    :return: int, the size of `line` in UTF-8 bytes
+    """
+    if isinstance(line, bytes) or line.isascii():
+        return len(line)
+
+    return len(line.encode('utf-8'))
+
+
+def _prescan_record_stream(line):
+    """
+    Scan the start of `line` for the `type` and `stream` of a RECORD, without decoding the line.
+    :param line: bytes or string
+    :return: string, the name of the stream when `line` starts as a RECORD, None otherwise
+    """
+    record_prefix, _ = _RECORD_PATTERNS[type(line)]
+
+    match = record_prefix.match(line)
+    if not match:
+        return None
+
+    stream = match.group(1)
+    if isinstance(stream, bytes):
+        stream = stream.decode('utf-8')
+    if '\\' in stream:
+        stream = json.loads('"{}"'.format(stream))
+
+    return stream
+
+
+def _prescan_discarded_record(state_tracker, line, stream):
+    """
+    Scan the end of `line`, a RECORD of `stream`, for its `version`, without decoding the record itself. Records
+    with a version older than their stream's are discarded by the stream, so there is no need to decode them.
+    :param state_tracker: StreamTracker
+    :param line: bytes or string
+    :param stream: string, see `_prescan_record_stream`
+    :return: {'type': 'RECORD', 'stream': ..., 'version': ...} when the record would be discarded, None otherwise
+    """
+    _, record_version_suffix = _RECORD_PATTERNS[type(line)]
+
+    stream_buffer = state_tracker.streams.get(stream)
+    if stream_buffer is None or stream_buffer.max_version is None:
+        return None
+
+    match = record_version_suffix.search(line, max(0, len(line) - _RECORD_VERSION_SUFFIX_LENGTH))
+    if not match:
+        return None
+
+    version = int(match.group(1))
+    if version >= stream_buffer.max_version:
+        return None
+
+    return {'type': 'RECORD', 'stream': stream, 'version': version}
+
+
+def _stream_requires_decimals(state_tracker, stream):
+    stream_buffer = state_tracker.streams.get(stream)
+    return stream_buffer is not None and stream_buffer.requires_decimals
+
+
+def _requires_decimals(state_tracker, line_data):
+    """
+    Numbers are stored as `double precision`, so `Decimal`s are only needed for SCHEMAs, whose `multipleOf`s
+    must be exact, and for RECORDs of streams validated against them.
+    :param state_tracker: StreamTracker
+    :param line_data: decoded line
+    :return: boolean
+    """
+    if not isinstance(line_data, dict):
+        return False
+
+    if line_data.get('type') == 'SCHEMA':
+        return True
+
+    if line_data.get('type') == 'RECORD':
+        return _stream_requires_decimals(state_tracker, line_data.get('stream'))
+
+    return False
+
+
+def _line_handler(state_tracker, target, invalid_records_detect, invalid_records_threshold, validation_mode,
+                  memory_accounting, spill_threshold, max_batch_rows, max_batch_size, line):
     try:
-        line_data = json.loads(line, parse_float=decimal.Decimal)
+        ## RECORDs starting with their `type` and `stream` are decoded once, with the numbers their stream needs.
+        ## Any other line is decoded again with `Decimal`s when it turns out to need them, like SCHEMAs.
+        stream = _prescan_record_stream(line)
+        if stream is not None:
+            line_data = _prescan_discarded_record(state_tracker, line, stream)
+            if line_data is None:
+                if _stream_requires_decimals(state_tracker, stream):
+                    line_data = _decode_json_decimal(line)
+                else:
+                    line_data = _decode_json_float(line)
+        else:
+            line_data = _decode_json_float(line)
+            if _requires_decimals(state_tracker, line_data):
+                line_data = _decode_json_decimal(line)
     except json.decoder.JSONDecodeError:
         LOGGER.error("Unable to parse JSON: {}".format(line))
         raise
@@ -124,7 +292,10 @@ def _line_handler(state_tracker, target, invalid_records_detect, invalid_records
                                                    schema,
                                                    key_properties,
                                                    invalid_records_detect=invalid_records_detect,
-                                                   invalid_records_threshold=invalid_records_threshold)
+                                                   invalid_records_threshold=invalid_records_threshold,
+                                                   validation_mode=validation_mode,
+                                                   memory_accounting=memory_accounting,
+                                                   spill_threshold=spill_threshold)
             if max_batch_rows:
                 buffered_stream.max_rows = max_batch_rows
             if max_batch_size:
@@ -137,7 +308,7 @@ def _line_handler(state_tracker, target, invalid_records_detect, invalid_records
         if 'stream' not in line_data:
             raise TargetError('`stream` is a required key: {}'.format(line))
 
-        line_data[RAW_LINE_SIZE] = len(line)
+        line_data[RAW_LINE_SIZE] = _line_size(line)
         state_tracker.handle_record_message(line_data['stream'], line_data)
     elif line_data['type'] == 'ACTIVATE_VERSION':
         if 'stream' not in line_data:
@@ -184,15 +355,27 @@ def _async_send_usage_stats():
     threading.Thread(target=_send_usage_stats()).start()
 
 
-def _run_sql_hook(hook_name, config, target):
-    if hook_name in config:
-        with target.conn.cursor() as cur:
-            cur.execute(config[hook_name])
-            LOGGER.debug('{} SQL executed'.format(hook_name))
-
-    hook_file = hook_name + '_file'
-    if hook_file in config:
-        with open(config[hook_file]) as f:
-            with target.conn.cursor() as cur:
-                cur.execute(f.read())
-                LOGGER.debug('{} SQL file executed'.format(hook_file))
+def _run_sql_hook(hook_name, config, target, table_connections=False):
+    """
+    Execute the `hook_name` SQL, and the contents of the `<hook_name>_file`, from `config` on the connection of `target`.
+    :param table_connections: [optional] whether to execute the SQL on the `table_connections` of `target` too
+    :return: None
+    """
+    connections = []
+    if hook_name in config or hook_name + '_file' in config:
+        connections.append(target.conn)
+        if table_connections:
+            connections += getattr(target, 'table_connections', [])
+
+    for connection in connections:
+        if hook_name in config:
+            with connection.cursor() as cur:
+                cur.execute(config[hook_name])
+                LOGGER.debug('{} SQL executed'.format(hook_name))
+
+        hook_file = hook_name + '_file'
+        if hook_file in config:
+            with open(config[hook_file]) as f:
+                with connection.cursor() as cur:
+                    cur.execute(f.read())
+                    LOGGER.debug('{} SQL file executed'.format(hook_file))
@@ -0,0 +1,302 @@
+from copy import deepcopy
+import decimal
+import threading
+
+from jsonschema import Draft4Validator, FormatChecker
+from jsonschema.exceptions import UnknownType
+
+## Keywords which compiled checks implement, and keywords which never affect validation. Schemas using any
+## other keyword are validated by `Draft4Validator` alone.
+_COMPILED_KEYWORDS = frozenset([
+    '$schema',
+    'additionalProperties',
+    'allOf',
+    'anyOf',
+    'default',
+    'definitions',
+    'description',
+    'format',
+    'id',
+    'items',
+    'properties',
+    'required',
+    'title',
+    'type'
+])
+
+_MISSING = object()
+
+VALIDATOR_CACHE_SIZE = 256
+
+_validators = {}
+_validators_lock = threading.Lock()
+
+
+class _Uncompilable(Exception):
+    """
+    Raised while compiling a schema which uses keywords compiled checks do not implement.
+    """
+
+
+def _check_all(checks):
+    if not checks:
+        return None
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check(instance):
+        for sub_check in checks:
+            if not sub_check(instance):
+                return False
+        return True
+
+    return check
+
+
+def _compile_type(types, validator):
+    if isinstance(types, str):
+        types = [types]
+
+    for t in types:
+        if not isinstance(t, str):
+            raise _Uncompilable(t)
+        try:
+            validator.is_type(None, t)
+        except UnknownType:
+            raise _Uncompilable(t)
+
+    ## Python type -> whether values of it match `types`
+    matches = {}
+
+    def check(instance):
+        instance_type = type(instance)
+        match = matches.get(instance_type)
+        if match is None:
+            match = matches[instance_type] = any(validator.is_type(instance, t) for t in types)
+        return match
+
+    return check
+
+
+def _compile_properties(properties, additional_properties, validator):
+    property_checks = []
+    for key, sub_schema in properties.items():
+        sub_check = _compile(sub_schema, validator)
+        if sub_check is not None:
+            property_checks.append((key, sub_check))
+
+    additional_check = None
+    if isinstance(additional_properties, dict):
+        additional_check = _compile(additional_properties, validator)
+    elif additional_properties is False:
+        additional_check = False
+
+    if not property_checks and additional_check is None:
+        return None
+
+    def check(instance):
+        if not isinstance(instance, dict):
+            return True
+
+        for key, sub_check in property_checks:
+            value = instance.get(key, _MISSING)
+            if value is not _MISSING and not sub_check(value):
+                return False
+
+        if additional_check is not None:
+            for key, value in instance.items():
+                if key in properties:
+                    continue
+                if additional_check is False or not additional_check(value):
+                    return False
+
+        return True
+
+    return check
+
+
+def _compile(schema, validator):
+    """
+    Compile `schema` into a function which returns whether an instance is valid, or `None` when
+    every instance is valid.
+    :param schema: dict, JSON Schema
+    :param validator: Draft4Validator
+    :return: function(instance) -> bool, or None
+    """
+    if not isinstance(schema, dict):
+        raise _Uncompilable(schema)
+
+    if not _COMPILED_KEYWORDS.issuperset(schema.keys()):
+        raise _Uncompilable(schema)
+
+    if not all(isinstance(schema.get(keyword, []), list) for keyword in ('allOf', 'anyOf', 'required')):
+        raise _Uncompilable(schema)
+
+    if not isinstance(schema.get('properties', {}), dict):
+        raise _Uncompilable(schema)
+
+    checks = []
+
+    if 'type' in schema:
+        checks.append(_compile_type(schema['type'], validator))
+
+    format_name = schema.get('format')
+    if format_name is not None \
+            and validator.format_checker is not None \
+            and format_name in validator.format_checker.checkers:
+        conforms = validator.format_checker.conforms
+        checks.append(lambda instance: conforms(instance, format_name))
+
+    if 'properties' in schema or 'additionalProperties' in schema:
+        properties_check = _compile_properties(schema.get('properties', {}),
+                                               schema.get('additionalProperties'),
+                                               validator)
+        if properties_check is not None:
+            checks.append(properties_check)
+
+    if 'required' in schema:
+        required = list(schema['required'])
+        checks.append(lambda instance: not isinstance(instance, dict)
+                                       or all(key in instance for key in required))
+
+    if 'items' in schema:
+        if not isinstance(schema['items'], dict):
+            raise _Uncompilable(schema)
+
+        items_check = _compile(schema['items'], validator)
+        if items_check is not None:
+            checks.append(lambda instance: not isinstance(instance, list)
+                                           or all(items_check(item) for item in instance))
+
+    if 'allOf' in schema:
+        for sub_schema in schema['allOf']:
+            sub_check = _compile(sub_schema, validator)
+            if sub_check is not None:
+                checks.append(sub_check)
+
+    if 'anyOf' in schema:
+        any_of_checks = [_compile(sub_schema, validator) for sub_schema in schema['anyOf']]
+        if None not in any_of_checks:
+            checks.append(lambda instance: any(sub_check(instance) for sub_check in any_of_checks))
+
+    return _check_all(checks)
+
+
+class RecordValidator():
+    """
+    Validates records against a JSON Schema with the same results as `Draft4Validator`.
+
+    The schema is compiled into plain Python checks where it only uses the keywords our
+    simplified schemas are made of, with the result of each type check cached per Python type.
+    Records which pass the compiled checks are valid. Any other record, or any record when the
+    schema could not be compiled, is handed to `Draft4Validator` so that errors are the same.
+    """
+
+    def __init__(self, schema):
+        self.schema = deepcopy(schema)
+        self._validator = Draft4Validator(self.schema, format_checker=FormatChecker())
+
+        try:
+            self._check = _compile(self.schema, self._validator) or (lambda instance: True)
+        except _Uncompilable:
+            self._check = None
+
+    @property
+    def compiled(self):
+        return self._check is not None
+
+    def is_valid(self, record):
+        if self._check is not None and self._check(record):
+            return True
+        return self._validator.is_valid(record)
+
+    def validate(self, record):
+        """
+        :param record: {...}
+        :raises: jsonschema.exceptions.ValidationError
+        """
+        if self._check is not None and self._check(record):
+            return
+        self._validator.validate(record)
+
+
+def requires_decimals(schema):
+    """
+    Given a JSON Schema, return whether it uses `multipleOf` anywhere. Checking `multipleOf` is only
+    reliable for numbers decoded as `Decimal`s, as binary floating point values are inexact.
+    :param schema: dict, JSON Schema
+    :return: boolean
+    """
+    if isinstance(schema, dict):
+        return 'multipleOf' in schema or any(requires_decimals(value) for value in schema.values())
+
+    if isinstance(schema, list):
+        return any(requires_decimals(value) for value in schema)
+
+    return False
+
+
+def types_only_schema(schema):
+    """
+    Given a simplified JSON Schema, return a JSON Schema which only checks the JSON types of values,
+    ie, without formats, defaults etc.
+    :param schema: dict, JSON Schema, see `json_schema.simplify`
+    :return: dict, JSON Schema
+    """
+    ret = {}
+
+    if 'type' in schema:
+        ret['type'] = schema['type']
+
+    if 'properties' in schema:
+        ret['properties'] = {key: types_only_schema(sub_schema)
+                             for key, sub_schema in schema['properties'].items()}
+
+    if 'items' in schema:
+        ret['items'] = types_only_schema(schema['items'])
+
+    if 'anyOf' in schema:
+        ret['anyOf'] = [types_only_schema(sub_schema) for sub_schema in schema['anyOf']]
+
+    return ret
+
+
+def schema_fingerprint(schema):
+    """
+    Given a JSON Schema, return a hashable value which is equal for equal schemas.
+    :param schema: dict, JSON Schema
+    :return: tuple
+    """
+    if isinstance(schema, dict):
+        return (dict, tuple(sorted((key, schema_fingerprint(value)) for key, value in schema.items())))
+
+    if isinstance(schema, (list, tuple)):
+        return (list, tuple(schema_fingerprint(value) for value in schema))
+
+    ## Types are kept so that `True`, `1` and `Decimal(1)` do not share a fingerprint
+    if isinstance(schema, decimal.Decimal):
+        return (decimal.Decimal, str(schema))
+
+    return (type(schema), schema)
+
+
+def get_validator(schema):
+    """
+    Return a RecordValidator for `schema`, reusing the one built for any equal schema.
+    :param schema: dict, JSON Schema
+    :return: RecordValidator
+    """
+    fingerprint = schema_fingerprint(schema)
+
+    with _validators_lock:
+        validator = _validators.get(fingerprint)
+        if validator is not None:
+            return validator
+
+    validator = RecordValidator(schema)
+
+    with _validators_lock:
+        if len(_validators) >= VALIDATOR_CACHE_SIZE:
+            _validators.pop(next(iter(_validators)))
+        return _validators.setdefault(fingerprint, validator)
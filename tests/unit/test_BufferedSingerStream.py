@@ -1,10 +1,14 @@
 from decimal import Decimal
 from copy import deepcopy
+import sys
+from unittest.mock import patch
 
+import arrow
 import pytest
 
 from target_postgres import singer
-from target_postgres.singer_stream import BufferedSingerStream, SingerStreamError, RAW_LINE_SIZE
+from target_postgres.singer_stream import BufferedRecord, BufferedSingerStream, SingerStreamError, RAW_LINE_SIZE, \
+    get_line_size, get_memory_size
 
 from utils.fixtures import CatStream, InvalidCatStream, CATS_SCHEMA
 
@@ -271,6 +275,206 @@ def test_add_record_message__invalid_record__cross_threshold():
     assert [] == missing_sdc_properties(singer_stream)
 
 
+@pytest.mark.parametrize('validation_mode', [None, 'full', 'types_only', 'sample:3'])
+def test_add_record_message__validation_mode__detects_invalid_types(validation_mode):
+    stream = InvalidCatStream(10)
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'],
+                                         invalid_records_threshold=2,
+                                         validation_mode=validation_mode)
+
+    singer_stream.add_record_message(stream.generate_record_message())
+
+    with pytest.raises(SingerStreamError):
+        for _ in range(7):
+            singer_stream.add_record_message(stream.generate_record_message())
+
+    assert len(singer_stream.peek_invalid_records()) == 2
+    ## Only the first and fourth records are validated when sampling 1 in 3
+    assert singer_stream.count == (2 if validation_mode == 'sample:3' else 0)
+
+
+def test_add_record_message__validation_mode__types_only():
+    stream = CatStream(10)
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'],
+                                         validation_mode='types_only')
+
+    record_message = stream.generate_record_message()
+    record_message['record']['not_in_schema'] = 'only rejected by `additionalProperties`'
+    singer_stream.add_record_message(record_message)
+
+    assert not singer_stream.peek_invalid_records()
+    assert singer_stream.count == 1
+
+    with pytest.raises(SingerStreamError):
+        singer_stream.add_record_message(InvalidCatStream(1).generate_record_message())
+
+
+def test_add_record_message__validation_mode__off():
+    stream = InvalidCatStream(10)
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'],
+                                         validation_mode='off')
+
+    for _ in range(10):
+        singer_stream.add_record_message(stream.generate_record_message())
+
+    assert not singer_stream.peek_invalid_records()
+    assert singer_stream.count == 10
+
+
+@pytest.mark.parametrize('validation_mode', ['everything', 'sample', 'sample:0', 'sample:n', 'full:2'])
+def test_init__unknown_validation_mode(validation_mode):
+    with pytest.raises(SingerStreamError):
+        BufferedSingerStream(CATS_SCHEMA['stream'],
+                             CATS_SCHEMA['schema'],
+                             CATS_SCHEMA['key_properties'],
+                             validation_mode=validation_mode)
+
+
+def test_get_memory_size():
+    record = {'a': 'b' * 1000, 'c': [Decimal('1.1'), {'d': None}]}
+
+    assert get_memory_size(record) > 1000
+    assert get_memory_size(record) > get_memory_size(record['c']) \
+           > get_memory_size(record['c'][1])
+
+
+def test_add_record_message__memory_accounting():
+    stream = CatStream(10)
+    record_message = stream.generate_record_message()
+    record_message[RAW_LINE_SIZE] = 100
+
+    by_line = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                   CATS_SCHEMA['schema'],
+                                   CATS_SCHEMA['key_properties'])
+    by_memory = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                     CATS_SCHEMA['schema'],
+                                     CATS_SCHEMA['key_properties'],
+                                     max_buffer_size=1000,
+                                     memory_accounting=True)
+
+    by_line.add_record_message(deepcopy(record_message))
+    by_memory.add_record_message(deepcopy(record_message))
+
+    assert by_line.size == 100
+    assert by_memory.size == sys.getsizeof(BufferedRecord(record_message)) \
+                             + get_memory_size(record_message['record'])
+    assert by_memory.size > 1000
+    assert by_memory.buffer_full
+
+
+def test_add_record_message__buffers_record_and_metadata():
+    stream = CatStream(10)
+    record_message = stream.generate_record_message()
+    record_message['version'] = 3
+    record_message['time_extracted'] = '2020-01-01T00:00:00Z'
+    record_message[RAW_LINE_SIZE] = 100
+
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         CATS_SCHEMA['key_properties'])
+    singer_stream.add_record_message(record_message)
+
+    buffered_record = singer_stream.peek_buffer()[0]
+    assert isinstance(buffered_record, BufferedRecord)
+    assert not hasattr(buffered_record, '__dict__')
+    assert buffered_record.record is record_message['record']
+    assert (buffered_record.version, buffered_record.time_extracted, buffered_record.sequence) \
+           == (3, '2020-01-01T00:00:00Z', record_message['sequence'])
+
+    [record] = singer_stream.get_batch()
+    assert record[singer.TABLE_VERSION] == 3
+    assert record[singer.RECEIVED_AT] == '2020-01-01T00:00:00Z'
+    assert record[singer.SEQUENCE] == record_message['sequence']
+
+
+def test_spill_threshold():
+    stream = CatStream(10)
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         [],
+                                         spill_threshold=1)
+
+    record_messages = [stream.generate_record_message() for _ in range(10)]
+    for record_message in record_messages:
+        singer_stream.add_record_message(record_message)
+
+    assert singer_stream.count == 10
+    assert len(singer_stream.peek_buffer()) == 10
+    ## Only the first record is held in memory
+    assert len(singer_stream.peek_buffer().records) == 1
+    assert singer_stream.size == get_line_size(record_messages[0])
+
+    batch = singer_stream.get_batch()
+    records = list(batch)
+
+    assert len(batch) == 10
+    assert [record['id'] for record in records] == [record['id'] for record in stream.records]
+    assert records == list(batch)
+    assert len(set(record[singer.PK] for record in records)) == 10
+
+    singer_stream.flush_buffer()
+    assert singer_stream.count == 0
+    assert singer_stream.peek_buffer() == []
+
+
+def test_spill_threshold__spill_file_closed_on_flush():
+    stream = CatStream(3)
+    singer_stream = BufferedSingerStream(CATS_SCHEMA['stream'],
+                                         CATS_SCHEMA['schema'],
+                                         [],
+                                         spill_threshold=1)
+
+    for _ in range(3):
+        singer_stream.add_record_message(stream.generate_record_message())
+    spill_file = singer_stream.peek_buffer().spill_file
+
+    singer_stream.flush_buffer()
+    assert spill_file.closed
+
+    for _ in range(3):
+        singer_stream.add_record_message(stream.generate_record_message())
+    spill_file = singer_stream.peek_buffer().spill_file
+
+    ## Detached records are still read from the file, until the detached copy is flushed
+    detached = singer_stream.detach_buffer()
+    assert not spill_file.closed
+    assert len(list(detached.get_batch())) == 3
+
+    detached.flush_buffer()
+    assert spill_file.closed
+
+
+def test_spill_threshold__sequences_follow_arrival():
+    singer_stream = BufferedSingerStream('cats',
+                                         {'properties': {'id': {'type': 'integer'},
+                                                         'name': {'type': 'string'}}},
+                                         ['id'],
+                                         spill_threshold=1)
+
+    now = arrow.get()
+    for seconds, name in [(0, 'old'), (1, 'new')]:
+        with patch.object(arrow, 'get', return_value=now.shift(seconds=seconds)):
+            singer_stream.add_record_message({'type': 'RECORD',
+                                              'stream': 'cats',
+                                              'record': {'id': 1, 'name': name},
+                                              RAW_LINE_SIZE: 10})
+
+    ## `old` is held in memory and `new` is spilled, batching them later must not reorder them
+    assert len(singer_stream.peek_buffer().records) == 1
+
+    with patch.object(arrow, 'get', return_value=now.shift(seconds=5)):
+        records = list(singer_stream.get_batch())
+
+    assert [record['name'] for record in records] == ['old', 'new']
+    assert records[0][singer.SEQUENCE] < records[1][singer.SEQUENCE]
+
+
 def mocked_mock_write_batch(stream_buffer):
     stream_buffer.flush_buffer()
 
@@ -0,0 +1,74 @@
+from target_postgres.batch_sizing import AdaptiveBatchSize
+
+
+def test_grows_while_throughput_improves():
+    batch_size = AdaptiveBatchSize(100, 1000)
+    assert batch_size.rows == 100
+
+    assert batch_size.batch_written(100, 1.0) == 200
+    assert batch_size.batch_written(200, 1.0) == 400
+    assert batch_size.batch_written(400, 1.0) == 800
+    assert batch_size.batch_written(800, 1.0) == 1000
+    assert batch_size.batch_written(1000, 1.2) == 1000
+
+    ## Throughput still improving at `max_rows` tries smaller batches
+    assert batch_size.batch_written(1000, 0.8) == 500
+    assert not batch_size.growing
+
+
+def test_shrinks_when_latency_grows_non_linearly():
+    batch_size = AdaptiveBatchSize(100, 10000)
+
+    batch_size.batch_written(100, 1.0)
+    batch_size.batch_written(200, 1.0)
+    assert batch_size.rows == 400
+
+    ## Twice the rows taking four times as long
+    assert batch_size.batch_written(400, 4.0) == 200
+    assert not batch_size.growing
+
+    ## Throughput recovers, keep shrinking until it does not improve anymore
+    assert batch_size.batch_written(200, 1.0) == 100
+    assert batch_size.batch_written(100, 0.5) == 100
+    assert batch_size.batch_written(100, 0.5) == 100
+
+    ## Throughput improving at `min_rows` grows batches again
+    assert batch_size.batch_written(100, 0.25) == 200
+    assert batch_size.growing
+    assert batch_size.batch_written(200, 0.25) == 400
+
+
+def test_holds_size_when_throughput_is_steady():
+    batch_size = AdaptiveBatchSize(100, 10000)
+
+    batch_size.batch_written(100, 1.0)
+    assert batch_size.batch_written(200, 2.0) == 200
+    assert batch_size.batch_written(200, 1.9) == 200
+
+
+def test_shrinks_when_memory_grows_non_linearly():
+    batch_size = AdaptiveBatchSize(100, 10000)
+
+    batch_size.batch_written(100, 1.0, 10000)
+    assert batch_size.batch_written(200, 1.0, 20000) == 400
+
+    ## Twice the rows taking three times the memory, although throughput improves
+    assert batch_size.batch_written(400, 1.0, 60000) == 200
+    assert not batch_size.growing
+
+    ## Steady throughput and memory per row hold the size
+    assert batch_size.batch_written(200, 0.5, 30000) == 200
+
+
+def test_ignores_partial_batches():
+    batch_size = AdaptiveBatchSize(100, 10000)
+    batch_size.batch_written(100, 1.0)
+
+    assert batch_size.batch_written(10, 10.0) == 200
+    assert batch_size.batch_written(200, 0.0) == 200
+    assert batch_size.last_throughput == 100
+
+
+def test_bounds():
+    assert AdaptiveBatchSize(500, 100).max_rows == 500
+    assert AdaptiveBatchSize(500, 100).batch_written(500, 1.0) == 500
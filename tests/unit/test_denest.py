@@ -1,4 +1,6 @@
+from copy import deepcopy
 import random
+import types
 
 import pytest
 from chance import chance
@@ -279,6 +281,24 @@ def test__records__nested__child_table__a_b_c_e():
         assert bool == type(record[('g',)][1])
 
 
+def test__records__nested__streamed():
+    records = deepcopy(NESTED_RECORDS)
+    table_batches = list(denest.iter_table_batches(NESTED_SCHEMA, [], records))
+
+    ## Nothing is denested until a table's records are consumed
+    assert records == NESTED_RECORDS
+    assert isinstance(table_batches[0]['records'], types.GeneratorType)
+
+    denested = error_check_denest(NESTED_SCHEMA, [], NESTED_RECORDS)
+    assert [batch['streamed_schema'] for batch in denested] \
+           == [batch['streamed_schema'] for batch in table_batches]
+    assert [batch['records'] for batch in denested] \
+           == [list(batch['records']) for batch in table_batches]
+
+    ## Records are left untouched by denesting
+    assert records == NESTED_RECORDS
+
+
 def test__anyOf__schema__stitch_date_times():
     denested = error_check_denest(
         {'properties': {
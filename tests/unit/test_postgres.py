@@ -1,14 +1,18 @@
 from copy import deepcopy
 from datetime import datetime
+from decimal import Decimal
 import json
+import time
+from unittest.mock import patch
 
+import arrow
 import psycopg2
 from psycopg2 import sql
 import psycopg2.extras
 import pytest
 
-from utils.fixtures import CatStream, CONFIG, db_cleanup, MultiTypeStream, NestedStream, TEST_DB, TypeChangeStream, DogStream
-from target_postgres import json_schema, main, postgres, singer, singer_stream
+from utils.fixtures import CatStream, CONFIG, db_cleanup, interleave, MultiTypeStream, NestedStream, TEST_DB, TypeChangeStream, DogStream
+from target_postgres import json_schema, main, postgres, singer, singer_stream, sql_base, target_tools
 from target_postgres.target_tools import TargetError
 
 
@@ -1184,6 +1188,109 @@ def test_loading__multi_types_columns(db_cleanup):
             assert stream_count == len([x for x in persisted_records if isinstance(x[0], float)])
 
 
+def test_loading__binary_copy(db_cleanup):
+    config = CONFIG.copy()
+    config['binary_copy'] = True
+
+    stream = CatStream(100, nested_count=2)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+
+        for record in stream.records:
+            record['paw_size'] = 314159
+            record['paw_colour'] = ''
+            record['flea_check_complete'] = False
+
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__binary_copy__multi_types_columns(db_cleanup):
+    config = CONFIG.copy()
+    config['binary_copy'] = True
+
+    stream_count = 50
+    stream = MultiTypeStream(stream_count)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL('SELECT {}, {} FROM {}').format(
+                sql.Identifier('_sdc_primary_key'),
+                sql.Identifier('number_which_only_comes_as_integer'),
+                sql.Identifier('root')
+            ))
+            persisted_records = cur.fetchall()
+
+            assert stream_count == len(persisted_records)
+            assert stream_count == len([x for x in persisted_records if isinstance(x[1], float)])
+
+            cur.execute(get_count_sql('root__every_type'))
+            assert cur.fetchone()[0] == sum(len(r['every_type']) for r in stream.records
+                                            if isinstance(r['every_type'], list))
+
+
+def test_loading__writer_connections(db_cleanup):
+    config = CONFIG.copy()
+    config['writer_connections'] = 2
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    cat_stream = CatStream(100, nested_count=2)
+    dog_stream = DogStream(50)
+
+    main(config, input_stream=interleave(cat_stream, dog_stream))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+            cur.execute(get_count_sql('dogs'))
+            assert cur.fetchone()[0] == 50
+
+        assert_records(conn, cat_stream.records, 'cats', 'id')
+        assert_records(conn, dog_stream.records, 'dogs', 'id')
+
+
+def test_loading__spill_threshold(db_cleanup):
+    config = CONFIG.copy()
+    config['spill_threshold'] = 1
+    config['max_batch_rows'] = 30
+    config['max_pending_batches'] = 1
+
+    cat_stream = CatStream(100, nested_count=2)
+    multi_type_stream = MultiTypeStream(50)
+
+    main(config, input_stream=interleave(cat_stream, multi_type_stream))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+            cur.execute(get_count_sql('root'))
+            assert cur.fetchone()[0] == 50
+
+            ## Generated primary keys of spilled records are the same for the root and nested tables
+            cur.execute(sql.SQL('SELECT COUNT(*) FROM {} JOIN {} ON {} = {}').format(
+                sql.Identifier('root__every_type'),
+                sql.Identifier('root'),
+                sql.Identifier('_sdc_source_key__sdc_primary_key'),
+                sql.Identifier('_sdc_primary_key')))
+            assert cur.fetchone()[0] == sum(len(r['every_type']) for r in multi_type_stream.records
+                                            if isinstance(r['every_type'], list))
+
+        assert_records(conn, cat_stream.records, 'cats', 'id')
+
+
 def test_loading__invalid__table_name__stream(db_cleanup):
     def invalid_stream_named(stream_name):
         stream = CatStream(100)
@@ -1986,6 +2093,173 @@ def test_deduplication_existing_new_rows(db_cleanup):
     assert sequences[0][0] == original_sequence
 
 
+def test_merge_strategy__on_conflict(db_cleanup):
+    config = CONFIG.copy()
+    config['merge_strategy'] = 'on_conflict'
+
+    stream = CatStream(100, nested_count=3, duplicates=2)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 300
+
+            cur.execute('SELECT _sdc_sequence FROM cats WHERE id in ({})'.format(
+                ','.join(map(str, stream.duplicate_pks_used))))
+            for record in cur.fetchall():
+                assert record[0] == stream.sequence + 200
+
+            cur.execute('''
+                SELECT i.relname FROM pg_index AS ix
+                    INNER JOIN pg_class AS i ON i.oid = ix.indexrelid
+                WHERE ix.indrelid = 'public.cats'::regclass AND ix.indisunique
+            ''')
+            assert len(cur.fetchall()) == 1
+
+    original_sequence = stream.sequence
+    duplicate_pks_used = stream.duplicate_pks_used
+
+    ## Older records do not overwrite newer ones
+    stream = CatStream(100, nested_count=2, sequence=original_sequence - 20)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+
+            cur.execute('SELECT DISTINCT _sdc_sequence FROM cats WHERE id NOT IN ({})'.format(
+                ','.join(map(str, duplicate_pks_used))))
+            assert cur.fetchall() == [(original_sequence,)]
+
+    ## Newer records do
+    stream = CatStream(100, nested_count=2, sequence=original_sequence + 1000)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+
+        for record in stream.records:
+            record['paw_size'] = 314159
+            record['paw_colour'] = ''
+            record['flea_check_complete'] = False
+
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_merge_strategy__on_conflict__indexes(db_cleanup):
+    config = CONFIG.copy()
+    config['merge_strategy'] = 'on_conflict'
+
+    main(config, input_stream=CatStream(10, nested_count=1))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT tablename, indexdef FROM pg_indexes WHERE schemaname = 'public' ORDER BY tablename")
+            indexes = [(table_name, index_definition.split(' INDEX ')[0], index_definition.split(' USING ')[1])
+                       for table_name, index_definition in cur.fetchall()]
+
+    ## Root tables only get the unique index on their key properties, subtables keep their upsert index
+    assert indexes == [('cats', 'CREATE UNIQUE', 'btree (id)'),
+                       ('cats__adoption__immunizations',
+                        'CREATE',
+                        'btree (_sdc_source_key_id, _sdc_sequence, _sdc_level_0_id)')]
+
+
+def test_merge_strategy__on_conflict__existing_table_without_unique_index(db_cleanup):
+    stream = CatStream(100)
+    main(CONFIG, input_stream=stream)
+
+    config = CONFIG.copy()
+    config['merge_strategy'] = 'on_conflict'
+
+    stream = CatStream(100, sequence=stream.sequence + 1000)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+
+            cur.execute('SELECT DISTINCT _sdc_sequence FROM cats')
+            assert cur.fetchall() == [(stream.sequence,)]
+
+
+def test_merge_strategy__invalid(db_cleanup):
+    config = CONFIG.copy()
+    config['merge_strategy'] = 'not_a_strategy'
+
+    with pytest.raises(postgres.PostgresError, match=r'.*merge_strategy.*'):
+        main(config, input_stream=CatStream(1))
+
+
+def test_append_only_streams(db_cleanup):
+    config = CONFIG.copy()
+    config['append_only_streams'] = ['cats']
+
+    stream = CatStream(100, nested_count=2, duplicates=2)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 102
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 204
+
+            duplicate_pks = set(stream.duplicate_pks_used)
+            cur.execute('SELECT count(*) FROM cats WHERE id in ({})'.format(
+                ','.join(map(str, duplicate_pks))))
+            assert cur.fetchone()[0] == len(duplicate_pks) + len(stream.duplicate_pks_used)
+
+
+def test_append_only_streams__merge_strategy__on_conflict(db_cleanup):
+    config = CONFIG.copy()
+    config['merge_strategy'] = 'on_conflict'
+    config['append_only_streams'] = ['cats']
+
+    stream = CatStream(100, duplicates=2)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 102
+
+            cur.execute("SELECT count(*) FROM pg_indexes WHERE tablename = 'cats' AND indexdef LIKE 'CREATE UNIQUE%'")
+            assert cur.fetchone()[0] == 0
+
+
+def test_append_only__no_key_properties(db_cleanup):
+    stream = CatStream(100, nested_count=2)
+    stream.schema = deepcopy(stream.schema)
+    stream.schema['key_properties'] = []
+
+    main(CONFIG, input_stream=stream)
+
+    stream = CatStream(100, nested_count=2)
+    stream.schema = deepcopy(stream.schema)
+    stream.schema['key_properties'] = []
+
+    main(CONFIG, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 200
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 400
+            cur.execute('SELECT count(DISTINCT _sdc_primary_key) FROM cats')
+            assert cur.fetchone()[0] == 200
+
+
 def test_multiple_batches_upsert(db_cleanup):
     config = CONFIG.copy()
     config['max_batch_rows'] = 20
@@ -2042,6 +2316,228 @@ def test_multiple_batches_by_memory_upsert(db_cleanup):
         assert_records(conn, stream.records, 'cats', 'id')
 
 
+class QueryRecordingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        self.connection.queries.append(self.mogrify(query, vars).decode('utf-8'))
+        return super(QueryRecordingCursor, self).execute(query, vars)
+
+
+class QueryRecordingConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super(QueryRecordingConnection, self).__init__(*args, **kwargs)
+        self.queries = []
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', QueryRecordingCursor)
+        return super(QueryRecordingConnection, self).cursor(*args, **kwargs)
+
+
+def test_table_schema_cache__reused_across_batches(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    with psycopg2.connect(connection_factory=QueryRecordingConnection, **TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn)
+        target_tools.stream_to_target(CatStream(100, nested_count=2), target, config=config)
+
+        schema_queries = [q for q in conn.queries if 'information_schema.columns' in q]
+        catalog_scans = [q for q in conn.queries if 'obj_description' in q]
+
+    ## 5 batches, 2 tables each, but remote schemas are only fetched while the tables are being created, and once
+    ## more by the batch after, as the caches are reloaded after every batch which changed the catalog
+    assert len(schema_queries) == 8
+    ## The 2 migration scans, the first batch and the reload
+    assert len(catalog_scans) == 4
+
+
+def test_table_schema_cache__catalog_changes_during_batch(db_cleanup):
+    with psycopg2.connect(**TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn)
+        commit_catalog_cache = target._commit_catalog_cache
+
+        def create_table_concurrently(cur):
+            ## Another session, eg, another writer of the target, creates a table while this batch is running
+            with psycopg2.connect(**TEST_DB) as other_conn:
+                with other_conn.cursor() as other_cur:
+                    other_cur.execute('CREATE TABLE dogs (id bigint);')
+                    other_cur.execute('COMMENT ON TABLE dogs IS \'{"path": ["dogs"]}\';')
+            commit_catalog_cache(cur)
+
+        with patch.object(target, '_commit_catalog_cache', side_effect=create_table_concurrently):
+            target_tools.stream_to_target(CatStream(10), target, config=CONFIG.copy())
+
+        with conn.cursor() as cur:
+            target.setup_table_mapping_cache(cur)
+            conn.rollback()
+
+        assert target.table_mapping_cache[('dogs',)] == 'dogs'
+
+
+def test_table_schema_fingerprint():
+    schema = {'path': ('cats',),
+              'key_properties': ['id'],
+              'schema': {'properties': {('id',): {'type': ['integer']},
+                                        ('weight',): {'type': ['null', 'number'], 'default': Decimal('1.5')}}}}
+    fingerprint = sql_base._table_schema_fingerprint(schema)
+
+    assert fingerprint == sql_base._table_schema_fingerprint(deepcopy(schema))
+
+    schema['schema']['properties'][('weight',)]['default'] = Decimal('2.5')
+    assert fingerprint != sql_base._table_schema_fingerprint(schema)
+
+
+def test_upsert_table_helper__unchanged_schema(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    with psycopg2.connect(connection_factory=QueryRecordingConnection, **TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn)
+        target_tools.stream_to_target(CatStream(100, nested_count=2), target, config=config)
+
+        ## Tables are only checked for emptiness while their schemas are reconciled, when they are created and once
+        ## the caches are reloaded after that
+        assert 4 == len([q for q in conn.queries if 'SELECT EXISTS (SELECT * FROM' in q])
+        assert set(target.upserted_table_schemas()) == {'cats', 'cats__adoption__immunizations'}
+
+        ## Rolled back batches drop what was upserted along with the rest of the catalog cache
+        target._reset_catalog_cache()
+        assert target.upserted_table_schemas() == {}
+
+        stream = CatStream(100, nested_count=2)
+        stream.schema = deepcopy(stream.schema)
+        stream.schema['schema']['properties']['favourite_toy'] = {'type': ['null', 'string']}
+        target_tools.stream_to_target(stream, target, config=config)
+
+        with conn.cursor() as cur:
+            assert_columns_equal(cur,
+                                 'cats',
+                                 {
+                                     ('_sdc_batched_at', 'timestamp with time zone', 'YES'),
+                                     ('_sdc_received_at', 'timestamp with time zone', 'YES'),
+                                     ('_sdc_sequence', 'bigint', 'YES'),
+                                     ('_sdc_table_version', 'bigint', 'YES'),
+                                     ('adoption__adopted_on', 'timestamp with time zone', 'YES'),
+                                     ('adoption__was_foster', 'boolean', 'YES'),
+                                     ('age', 'bigint', 'YES'),
+                                     ('id', 'bigint', 'NO'),
+                                     ('name', 'text', 'NO'),
+                                     ('bio', 'text', 'NO'),
+                                     ('paw_size', 'bigint', 'NO'),
+                                     ('paw_colour', 'text', 'NO'),
+                                     ('flea_check_complete', 'boolean', 'NO'),
+                                     ('pattern', 'text', 'YES'),
+                                     ('favourite_toy', 'text', 'YES')
+                                 })
+
+
+def test_upsert_table_helper__single_alteration_and_metadata_write_per_table(db_cleanup):
+    with psycopg2.connect(connection_factory=QueryRecordingConnection, **TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn)
+        target_tools.stream_to_target(CatStream(100, nested_count=2), target, config=CONFIG)
+
+        comments = [q for q in conn.queries if q.startswith('COMMENT ON TABLE')]
+        alterations = [q for q in conn.queries if q.strip().startswith('ALTER TABLE')]
+
+    assert 2 == len(comments)
+    assert 2 == len(alterations)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            target = postgres.PostgresTarget(conn)
+            metadata = target._get_table_metadata(cur, 'cats')
+
+            assert metadata['key_properties'] == ['id']
+            assert metadata['path'] == ['cats']
+            assert metadata['mappings']['adoption__adopted_on'] == {'type': ['string', 'null'],
+                                                                    'from': ['adoption', 'adopted_on'],
+                                                                    'format': 'date-time'}
+
+
+def test_table_schema_cache__invalidated_by_external_changes(db_cleanup):
+    with psycopg2.connect(**TEST_DB) as conn:
+        target = postgres.PostgresTarget(conn)
+
+        target_tools.stream_to_target(CatStream(100), target, config=CONFIG)
+
+        with psycopg2.connect(**TEST_DB) as other_conn:
+            with other_conn.cursor() as cur:
+                cur.execute('DROP TABLE cats; DROP TABLE cats__adoption__immunizations;')
+
+        stream = CatStream(50)
+        target_tools.stream_to_target(stream, target, config=CONFIG)
+
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 50
+
+
+def test_table_connections(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    stream = CatStream(100, nested_count=2)
+
+    with psycopg2.connect(connection_factory=QueryRecordingConnection, **TEST_DB) as conn, \
+            psycopg2.connect(connection_factory=QueryRecordingConnection, **TEST_DB) as table_conn_1, \
+            psycopg2.connect(connection_factory=QueryRecordingConnection, **TEST_DB) as table_conn_2:
+        target = postgres.PostgresTarget(conn, table_connections=[table_conn_1, table_conn_2])
+        target_tools.stream_to_target(stream, target, config=config)
+
+        staged_tables = lambda c: [q for q in c.queries if 'CREATE TEMPORARY TABLE' in q]
+
+        ## The first batch creates the tables, so its tables are written through the batch's transaction
+        assert len(staged_tables(conn)) == 2
+        ## The 4 remaining batches write their 2 tables over the table connections
+        assert len(staged_tables(table_conn_1)) + len(staged_tables(table_conn_2)) == 8
+
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_table_connections__root_table_commits_first(db_cleanup):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    ## (whether the connection wrote the root table, whether the batch's own transaction was still open)
+    commits = []
+
+    class CommitRecordingConnection(psycopg2.extensions.connection):
+        def commit(self):
+            if self.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+                commits.append((self is target._root_table_connection,
+                                conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS))
+            return super(CommitRecordingConnection, self).commit()
+
+    write_table_batch = postgres.PostgresTarget._write_table_batch
+
+    def slow_write_table_batch(self, cur, table_batch, metadata):
+        ## Keep each table connection busy long enough for the next table to be written over the other
+        time.sleep(0.05)
+        return write_table_batch(self, cur, table_batch, metadata)
+
+    with psycopg2.connect(**TEST_DB) as conn, \
+            psycopg2.connect(connection_factory=CommitRecordingConnection, **TEST_DB) as table_conn_1, \
+            psycopg2.connect(connection_factory=CommitRecordingConnection, **TEST_DB) as table_conn_2, \
+            patch.object(postgres.PostgresTarget, '_write_table_batch', slow_write_table_batch):
+        target = postgres.PostgresTarget(conn, table_connections=[table_conn_1, table_conn_2])
+        target_tools.stream_to_target(CatStream(100, nested_count=2), target, config=config)
+        target.close()
+
+    ## The 4 batches after the first write their tables over the table connections. Root tables commit before
+    ## the batch's own transaction, nested tables after it.
+    assert commits == [(True, True), (False, False)] * 4
+    assert target._table_writers is None
+
+
 def test_loading__very_long_stream_name(db_cleanup):
     stream_name = 'extremely_______________long_cats'
     class LongCatStream(CatStream):
@@ -2112,3 +2608,38 @@ def test_before_run_sql_is_executed_upon_construction(db_cleanup):
 
             cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema='public' AND table_name='after_sql_test';")
             assert cur.fetchone()[0] == 'after_sql_test'
+
+
+def test_transform_stream__chunked_reads():
+    rows = [[i, 'cat, {}'.format(i), postgres.RESERVED_NULL_DEFAULT] for i in range(2500)]
+    expected = ''.join('{},"cat, {}",NULL\r\n'.format(i, i) for i in range(2500))
+
+    stream = postgres.TransformStream(rows, rows_per_chunk=100)
+
+    chunks = []
+    while True:
+        chunk = stream.read(4096)
+        if not chunk:
+            break
+        assert len(chunk) <= 4096
+        chunks.append(chunk)
+
+    assert len(chunks) > 1
+    assert ''.join(chunks) == expected
+    assert postgres.TransformStream(rows).read() == expected
+
+
+@pytest.mark.parametrize('value', ['2117-12-12T12:11:00',
+                                   '2020-01-01T00:00:00Z',
+                                   '2020-01-01T05:06:07.123456+02:30',
+                                   '1999-12-31T23:59:59.9999-05:00',
+                                   '2020-01-01',
+                                   '2020-06-01T12:00:00.5Z',
+                                   '20200601T120000Z'])
+def test_serialize_datetime_value(value):
+    parsed = arrow.get(value)
+    epoch_delta = parsed - arrow.get('2000-01-01T00:00:00+00:00')
+
+    assert postgres._format_datetime(value) == parsed.format('YYYY-MM-DD HH:mm:ss.SSSSZZ')
+    assert postgres._datetime_to_postgres_micros(value) \
+           == (epoch_delta.days * 86400 + epoch_delta.seconds) * 1000000 + epoch_delta.microseconds
@@ -1,11 +1,16 @@
 from copy import deepcopy
+from decimal import Decimal
 import json
+import threading
+from types import SimpleNamespace
 
 from unittest.mock import patch
 import pytest
 
 from target_postgres import singer_stream
+from target_postgres import stream_tracker
 from target_postgres import target_tools
+from target_postgres.exceptions import TargetError
 from target_postgres.sql_base import SQLInterface
 
 from utils.fixtures import CONFIG, CatStream, ListStream, InvalidCatStream, DogStream
@@ -154,6 +159,136 @@ def test_record_with_multiple_of():
     assert rows_persisted == expected_rows
 
 
+def test_record_numbers__decimals_only_for_multiple_of():
+    class TestStream(ListStream):
+        stream = [
+            {'type': 'SCHEMA',
+             'stream': 'floats',
+             'schema': {'properties': {'value': {'type': 'number'}}},
+             'key_properties': []},
+            {'type': 'SCHEMA',
+             'stream': 'decimals',
+             'schema': {'properties': {'value': {'type': 'number', 'multipleOf': 0.01}}},
+             'key_properties': []},
+            {'type': 'RECORD', 'stream': 'floats', 'record': {'value': 1.1}},
+            {'type': 'RECORD', 'stream': 'decimals', 'record': {'value': 1.1}}
+        ]
+
+    values = {}
+
+    class RecordingTarget(Target):
+        def write_batch(self, stream_buffer):
+            values[stream_buffer.stream] = stream_buffer.peek_buffer()[0].record['value']
+
+    with patch.object(target_tools, '_decode_json_float', wraps=target_tools._decode_json_float) as decode_float, \
+            patch.object(target_tools, '_decode_json_decimal', wraps=target_tools._decode_json_decimal) as decode_decimal:
+        target_tools.stream_to_target(TestStream(), RecordingTarget(), config=CONFIG.copy())
+
+    ## SCHEMAs are decoded again with `Decimal`s, RECORDs only once
+    assert decode_float.call_count == 2 + 1
+    assert decode_decimal.call_count == 2 + 1
+
+    assert values == {'floats': 1.1, 'decimals': Decimal('1.1')}
+    assert type(values['floats']) is float
+    assert type(values['decimals']) is Decimal
+
+
+def prescan_stream_tracker(max_version):
+    stream_buffer = singer_stream.BufferedSingerStream('abc',
+                                                       {'properties': {'a': {'type': 'integer'}}},
+                                                       [])
+    stream_buffer.add_record_message({'type': 'RECORD', 'stream': 'abc', 'record': {'a': 1}, 'version': max_version})
+
+    return SimpleNamespace(streams={'abc': stream_buffer})
+
+
+@pytest.mark.parametrize('line,discarded', [
+    ('{"type": "RECORD", "stream": "abc", "record": {"a": 1}, "version": 1}', True),
+    ('{"type": "RECORD", "stream": "abc", "record": {"a": 1}, "version": 1, "time_extracted": "2020-01-01T00:00:00Z"}\n', True),
+    ('{"type":"RECORD","stream":"abc","record":{"a":1},"sequence":12,"version":1,"time_extracted":"2020"}', True),
+    ('{"type": "RECORD", "stream": "abc", "record": {"a": 1}, "version": 5}', False),
+    ('{"type": "RECORD", "stream": "abc", "record": {"a": 1}, "version": 7}', False),
+    ('{"type": "RECORD", "stream": "abc", "record": {"a": 1}}', False),
+    ('{"type": "RECORD", "stream": "abc", "record": {"a": 1, "version": 1}}', False),
+    ('{"type": "RECORD", "stream": "abc", "record": {"a": [{"version": 1}]}, "version": 5}', False),
+    (json.dumps({'type': 'RECORD', 'stream': 'abc', 'record': {'b': 'x", "version": 1}'}}), False),
+    ('{"type": "RECORD", "stream": "other", "record": {"a": 1}, "version": 1}', False),
+    ('{"stream": "abc", "type": "RECORD", "record": {"a": 1}, "version": 1}', False),
+    ('{"type": "STATE", "value": {"version": 1}}', False)
+])
+@pytest.mark.parametrize('encoded', [False, True])
+def test_prescan_discarded_record(line, discarded, encoded):
+    if encoded:
+        line = line.encode('utf-8')
+
+    prescanned = None
+    stream = target_tools._prescan_record_stream(line)
+    if stream is not None:
+        prescanned = target_tools._prescan_discarded_record(prescan_stream_tracker(5), line, stream)
+
+    if discarded:
+        assert prescanned == {'type': 'RECORD', 'stream': 'abc', 'version': 1}
+        assert json.loads(line)['version'] == 1
+    else:
+        assert prescanned is None
+
+
+def test_prescan_discarded_record__escaped_stream():
+    tracker = prescan_stream_tracker(5)
+    tracker.streams['a"b'] = tracker.streams.pop('abc')
+
+    line = '{"type": "RECORD", "stream": "a\\"b", "record": {}, "version": 1}'
+
+    assert target_tools._prescan_record_stream(line) == 'a"b'
+    assert target_tools._prescan_discarded_record(tracker, line, 'a"b') \
+           == {'type': 'RECORD', 'stream': 'a"b', 'version': 1}
+
+
+def test_record_older_versions__are_not_decoded():
+    config = CONFIG.copy()
+
+    def records(version, n):
+        return [{'type': 'RECORD', 'stream': 'abc', 'record': {'a': i}, 'version': version} for i in range(n)]
+
+    class TestStream(ListStream):
+        stream = [{'type': 'SCHEMA',
+                   'stream': 'abc',
+                   'schema': {'properties': {'a': {'type': 'integer'}}},
+                   'key_properties': []}] \
+                 + records(2, 3) + records(1, 10) + records(2, 4)
+
+    target = Target()
+
+    with patch.object(target_tools, '_decode_json_float', wraps=target_tools._decode_json_float) as decode:
+        target_tools.stream_to_target(TestStream(), target, config=config)
+
+    assert decode.call_count == 1 + 3 + 4
+    assert sum(call['records_count'] for call in target.calls['write_batch']) == 7
+
+
+@pytest.mark.parametrize('encoded', [False, True])
+def test_record_line_size__in_bytes(encoded):
+    records = [{'type': 'RECORD', 'stream': 'abc', 'record': {'a': name}} for name in ['cat', 'chat', 'gato', '猫']]
+    lines = [json.dumps({'type': 'SCHEMA',
+                         'stream': 'abc',
+                         'schema': {'properties': {'a': {'type': 'string'}}},
+                         'key_properties': []})] \
+            + [json.dumps(record, ensure_ascii=False) for record in records]
+
+    sizes = []
+
+    class RecordingTarget(Target):
+        def write_batch(self, stream_buffer):
+            sizes.append(stream_buffer.size)
+
+    target_tools.stream_to_target([line.encode('utf-8') if encoded else line for line in lines],
+                                  RecordingTarget(),
+                                  config=CONFIG.copy())
+
+    assert sizes == [sum(len(line.encode('utf-8')) for line in lines[1:])]
+    assert sizes[0] > sum(len(line) for line in lines[1:])
+
+
 def test_state__capture(capsys):
     stream = [
         json.dumps({'type': 'STATE', 'value': {'test': 'state-1'}}),
@@ -351,3 +486,246 @@ def test_state__doesnt_emit_when_it_isnt_different_than_the_previous_emission(ca
 
     output = filtered_output(capsys)
     assert len(output) == 0
+
+
+def test_max_memory__flushes_all_streams():
+    config = CONFIG.copy()
+    config['batch_detection_threshold'] = 5
+    config['max_memory'] = 1024
+
+    target = Target()
+
+    with patch.object(stream_tracker, 'get_rss', return_value=2048):
+        target_tools.stream_to_target(CatStream(20), target, config=config)
+
+    ## The first check flushes every record buffered, the first line being the SCHEMA
+    records_counts = [call['records_count'] for call in target.calls['write_batch']]
+    assert records_counts[0] == 5
+    assert sum(records_counts) == 20
+
+
+def test_max_memory__flushes_again_once_buffers_refill():
+    target = Target()
+    tracker = stream_tracker.StreamTracker(target, False, max_memory=1024)
+    tracker.register_stream('cats', singer_stream.BufferedSingerStream('cats',
+                                                                       {'properties': {'a': {'type': 'integer'}}},
+                                                                       []))
+
+    def add_records(count):
+        for i in range(count):
+            tracker.handle_record_message('cats', {'type': 'RECORD',
+                                                   'stream': 'cats',
+                                                   'record': {'a': i},
+                                                   singer_stream.RAW_LINE_SIZE: 100})
+
+    ## Resident memory stays over the budget after the first flush
+    with patch.object(stream_tracker, 'get_rss', return_value=2048):
+        add_records(10)
+        tracker.flush_streams()
+        assert [call['records_count'] for call in target.calls['write_batch']] == [10]
+
+        add_records(5)
+        tracker.flush_streams()
+        assert [call['records_count'] for call in target.calls['write_batch']] == [10]
+
+        add_records(5)
+        tracker.flush_streams()
+        assert [call['records_count'] for call in target.calls['write_batch']] == [10, 10]
+
+    ## Dropping under the budget starts over
+    with patch.object(stream_tracker, 'get_rss', return_value=512):
+        add_records(5)
+        tracker.flush_streams()
+        assert tracker.memory_flushed_size is None
+
+    with patch.object(stream_tracker, 'get_rss', return_value=2048):
+        tracker.flush_streams()
+        assert [call['records_count'] for call in target.calls['write_batch']] == [10, 10, 5]
+
+
+def test_max_memory__under_budget():
+    config = CONFIG.copy()
+    config['batch_detection_threshold'] = 5
+    config['max_memory'] = 1024
+
+    target = Target()
+
+    with patch.object(stream_tracker, 'get_rss', return_value=512):
+        target_tools.stream_to_target(CatStream(20), target, config=config)
+
+    assert [call['records_count'] for call in target.calls['write_batch']] == [20]
+
+
+def test_max_total_buffer_size__flushes_largest_streams_first():
+    class RecordingTarget(Target):
+        def write_batch(self, stream_buffer):
+            self.calls['write_batch'].append((stream_buffer.stream, stream_buffer.count))
+
+    target = RecordingTarget()
+    tracker = stream_tracker.StreamTracker(target, False, max_buffer_size=1000)
+
+    for stream, line_size in [('small', 100), ('large', 400), ('medium', 300)]:
+        tracker.register_stream(stream, singer_stream.BufferedSingerStream(stream,
+                                                                          {'properties': {'a': {'type': 'integer'}}},
+                                                                          []))
+        for i in range(2):
+            tracker.handle_record_message(stream, {'type': 'RECORD',
+                                                   'stream': stream,
+                                                   'record': {'a': i},
+                                                   singer_stream.RAW_LINE_SIZE: line_size})
+
+    ## 1600 bytes are buffered, flushing `large` is enough to fit back into 1000
+    tracker.flush_streams()
+    assert target.calls['write_batch'] == [('large', 2)]
+
+    tracker.handle_record_message('medium', {'type': 'RECORD',
+                                             'stream': 'medium',
+                                             'record': {'a': 3},
+                                             singer_stream.RAW_LINE_SIZE: 300})
+    tracker.flush_streams()
+    assert target.calls['write_batch'] == [('large', 2), ('medium', 3)]
+    assert tracker.streams['small'].count == 2
+
+
+def test_adaptive_batch_rows__follow_write_latency():
+    class SlowTarget(Target):
+        def write_batch(self, stream_buffer):
+            super().write_batch(stream_buffer)
+            ## A fixed cost per batch, plus a cost which grows with the square of the batch size
+            clock.append(clock[-1] + 1 + (stream_buffer.count / 400) ** 2)
+
+    clock = [0.0]
+    target = SlowTarget()
+    tracker = stream_tracker.StreamTracker(target, False, batch_rows=(100, 10000))
+    stream_buffer = singer_stream.BufferedSingerStream('cats', {'properties': {'a': {'type': 'integer'}}}, [])
+    tracker.register_stream('cats', stream_buffer)
+    assert stream_buffer.max_rows == 100
+
+    batches = []
+    with patch.object(stream_tracker.time, 'monotonic', side_effect=lambda: clock[-1]):
+        for i in range(4000):
+            tracker.handle_record_message('cats', {'type': 'RECORD',
+                                                   'stream': 'cats',
+                                                   'record': {'a': i},
+                                                   singer_stream.RAW_LINE_SIZE: 10})
+            if stream_buffer.buffer_full:
+                batches.append(stream_buffer.count)
+                tracker.flush_stream('cats')
+
+    ## Throughput peaks at 400 rows per batch
+    assert batches[:6] == [100, 200, 400, 800, 400, 200]
+    assert max(batches) == 800
+
+
+def test_pipelined_writes__loads_all_records(capsys):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 1
+    config['max_pending_batches'] = 2
+    rows = list(CatStream(100))
+    rows.append(json.dumps({'type': 'STATE', 'value': {'test': 'state-1'}}))
+    target = Target()
+
+    target_tools.stream_to_target(rows, target, config=config)
+
+    assert sum(call['records_count'] for call in target.calls['write_batch']) == 100
+    output = filtered_output(capsys)
+    assert len(output) == 1
+    assert json.loads(output[0])['test'] == 'state-1'
+
+
+def test_pipelined_writes__spill_files_are_closed():
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 1
+    config['max_pending_batches'] = 2
+    config['spill_threshold'] = 1
+    spill_files = []
+
+    class RecordingTarget(Target):
+        def write_batch(self, stream_buffer):
+            if stream_buffer.count:
+                spill_files.append(stream_buffer.peek_buffer().spill_file)
+            return super().write_batch(stream_buffer)
+
+    target_tools.stream_to_target(CatStream(100), RecordingTarget(), config=config)
+
+    assert len(spill_files) == 5
+    assert all(spill_file.closed for spill_file in spill_files)
+
+
+def test_pipelined_writes__state_waits_for_writer(capsys):
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 1
+    config['max_pending_batches'] = 1
+    rows = list(CatStream(100))
+    write_allowed = threading.Event()
+
+    class BlockingTarget(Target):
+        def write_batch(self, stream_buffer):
+            write_allowed.wait()
+            return super(BlockingTarget, self).write_batch(stream_buffer)
+
+    target = BlockingTarget()
+
+    def test_stream():
+        for row in rows[slice(0, 5)]:
+            yield row
+        yield json.dumps({'type': 'STATE', 'value': {'test': 'state-1'}})
+        for row in rows[slice(5, 25)]:
+            yield row
+        yield json.dumps({'type': 'STATE', 'value': {'test': 'state-2'}})
+
+        # The first batch has been handed to the writer, but it has not been saved yet
+        assert len(target.calls['write_batch']) == 0
+        assert filtered_output(capsys) == []
+
+        write_allowed.set()
+        for row in rows[slice(25, 30)]:
+            yield row
+
+    target_tools.stream_to_target(test_stream(), target, config=config)
+
+    assert sum(call['records_count'] for call in target.calls['write_batch']) == 29
+    output = filtered_output(capsys)
+    assert len(output) == 1
+    assert json.loads(output[0])['test'] == 'state-2'
+
+
+def test_pipelined_writes__writer_errors_are_raised():
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 1
+    config['max_pending_batches'] = 1
+
+    class FailingTarget(Target):
+        def write_batch(self, stream_buffer):
+            raise TargetError('Write failed')
+
+    with pytest.raises(TargetError, match=r'Write failed'):
+        target_tools.stream_to_target(list(CatStream(100)), FailingTarget(), config=config)
+
+
+def test_writer_targets__streams_are_written_by_a_single_target():
+    config = CONFIG.copy()
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 1
+    cat_rows = list(CatStream(100))
+    dog_rows = list(DogStream(50))
+    target = Target()
+    writer_target = Target()
+
+    def test_stream():
+        yield cat_rows[0]
+        yield dog_rows[0]
+        for cat_row, dog_row in zip(cat_rows[1:], dog_rows[1:] + [None] * 50):
+            yield cat_row
+            if dog_row:
+                yield dog_row
+
+    target_tools.stream_to_target(test_stream(), target, config=config, writer_targets=[writer_target])
+
+    ## The first stream to be flushed is written by `target`, the second one by `writer_target`
+    assert sum(call['records_count'] for call in target.calls['write_batch']) == 100
+    assert sum(call['records_count'] for call in writer_target.calls['write_batch']) == 50
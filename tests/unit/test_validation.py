@@ -0,0 +1,136 @@
+from copy import deepcopy
+from decimal import Decimal
+
+from jsonschema import Draft4Validator, FormatChecker
+from jsonschema.exceptions import ValidationError
+import pytest
+
+from target_postgres import validation
+
+from utils.fixtures import CatStream, InvalidCatStream, MultiTypeStream, NestedStream, CATS_SCHEMA
+
+
+def assert_same_as_draft4(schema, records):
+    validator = validation.RecordValidator(schema)
+    draft4 = Draft4Validator(schema, format_checker=FormatChecker())
+
+    assert validator.compiled
+
+    for record in records:
+        assert validator._check(record) == draft4.is_valid(record)
+        assert validator.is_valid(record) == draft4.is_valid(record)
+
+
+@pytest.mark.parametrize('stream', [CatStream, InvalidCatStream, MultiTypeStream, NestedStream])
+def test_compiled__fixture_streams(stream):
+    fake_stream = stream(200)
+    assert_same_as_draft4(fake_stream.schema['schema'],
+                          [fake_stream.generate_record() for _ in range(200)])
+
+
+def test_compiled__types():
+    schema = {'type': 'object',
+              'required': ['a'],
+              'properties': {
+                  'a': {'type': ['integer']},
+                  'b': {'type': ['null', 'number']},
+                  'c': {'type': 'array', 'items': {'type': 'string'}},
+                  'd': {'anyOf': [{'type': 'boolean'}, {'type': 'object', 'additionalProperties': {'type': 'integer'}}]}},
+              'additionalProperties': False}
+
+    assert_same_as_draft4(schema, [
+        {'a': 1},
+        {'a': True},
+        {'a': 1.0},
+        {'a': Decimal(1)},
+        {'b': 1},
+        {'a': 1, 'b': None},
+        {'a': 1, 'b': 1.5},
+        {'a': 1, 'b': Decimal('1.5')},
+        {'a': 1, 'b': False},
+        {'a': 1, 'b': '1.5'},
+        {'a': 1, 'c': []},
+        {'a': 1, 'c': ['x', 'y']},
+        {'a': 1, 'c': ['x', 1]},
+        {'a': 1, 'c': 'x'},
+        {'a': 1, 'd': True},
+        {'a': 1, 'd': {'x': 1}},
+        {'a': 1, 'd': {'x': 'y'}},
+        {'a': 1, 'd': None},
+        {'a': 1, 'e': None},
+        [],
+        None
+    ])
+
+
+def test_uncompiled_keywords():
+    schema = {'type': 'object',
+              'properties': {
+                  'a': {'type': 'integer', 'minimum': 10}}}
+
+    validator = validation.RecordValidator(schema)
+
+    assert not validator.compiled
+    assert validator.is_valid({'a': 10})
+    assert not validator.is_valid({'a': 9})
+    with pytest.raises(ValidationError):
+        validator.validate({'a': 9})
+
+
+def test_uncompiled_keywords__unique_items():
+    validator = validation.RecordValidator({'type': 'array', 'uniqueItems': True})
+
+    assert not validator.compiled
+    assert validator.is_valid([1, 2])
+    assert not validator.is_valid([1, 1])
+
+
+def test_uncompiled_keywords__unknown():
+    validator = validation.RecordValidator({'type': 'object', 'x-not-a-keyword': True})
+
+    assert not validator.compiled
+    assert validator.is_valid({})
+    assert not validator.is_valid([])
+
+
+def test_compiled_keywords__annotations():
+    assert_same_as_draft4({'title': 'cats',
+                           'description': 'Cats',
+                           'type': 'object',
+                           'properties': {'a': {'type': 'integer', 'default': 1}}},
+                          [{'a': 1}, {'a': 'b'}])
+
+
+def test_validate__raises_draft4_error():
+    validator = validation.RecordValidator(CATS_SCHEMA['schema'])
+    record = CatStream(1).generate_record()
+    record['age'] = 'very invalid age'
+
+    with pytest.raises(ValidationError) as excinfo:
+        validator.validate(record)
+
+    expected = next(Draft4Validator(CATS_SCHEMA['schema']).iter_errors(record))
+    assert excinfo.value.message == expected.message
+    assert list(excinfo.value.path) == list(expected.path)
+
+
+def test_get_validator__cached_by_fingerprint():
+    schema = deepcopy(CATS_SCHEMA['schema'])
+
+    validator = validation.get_validator(schema)
+
+    assert validation.get_validator(deepcopy(CATS_SCHEMA['schema'])) is validator
+
+    schema['properties']['age']['type'] = ['null', 'number']
+    assert validation.get_validator(schema) is not validator
+    assert validator.is_valid({'age': 1})
+    assert not validator.is_valid({'age': 1.5})
+
+
+def test_schema_fingerprint():
+    assert validation.schema_fingerprint({'a': [1, {'b': 'c'}], 'd': True}) \
+           == validation.schema_fingerprint({'d': True, 'a': [1, {'b': 'c'}]})
+    assert validation.schema_fingerprint({'default': True}) \
+           != validation.schema_fingerprint({'default': 1})
+    assert validation.schema_fingerprint({'multipleOf': Decimal('0.01')}) \
+           != validation.schema_fingerprint({'multipleOf': '0.01'})
@@ -1,3 +1,4 @@
+from itertools import zip_longest
 import json
 import os
 import random
@@ -521,6 +522,16 @@ class ListStream:
         raise StopIteration
 
 
+def interleave(*streams):
+    """
+    Yield the lines of `streams` in turn, until all of them are exhausted.
+    """
+    for lines in zip_longest(*streams):
+        for line in lines:
+            if line:
+                yield line
+
+
 class DogStream(CatStream):
     stream = 'dogs'
     schema = CatStream.schema.copy()